@@ -0,0 +1,8 @@
+"""
+Benchmarks of the hot paths of remoteinstr. Every module can be run as a script from the root of the project, e.g.
+
+    python -m benchmarks.bench_delete
+
+The ones that use the database work on a temporary SQLite database, never on the configured one.
+"""
+__author__ = 'macastro'
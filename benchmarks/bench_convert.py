@@ -0,0 +1,69 @@
+"""
+Micro-benchmark of the hex conversions of convert_tools (used by the raw managers) from 16 B to 16 MB, against the
+old implementations (string concatenation per byte). The outputs are checked to be identical.
+"""
+__author__ = 'macastro'
+
+import os
+import re
+import timeit
+
+from remoteinstrapp.utils import convert_tools as ct
+
+SIZES = (16, 256, 4096, 65536, 1 << 20, 16 << 20)
+LEGACY_LIMIT = 1 << 20  # the old implementations are too slow for bigger payloads
+
+
+def legacy_simple_hex_to_formal_hex(hex_simple_str):
+    pat = re.compile(r'([0-9A-Fa-f])+')
+    if not pat.match(hex_simple_str) and len(hex_simple_str) % 2 != 0:
+        return ''
+    hex_str = ''
+    i = 0
+    while i < len(hex_simple_str):
+        hex_str += r'\x' + hex_simple_str[i:i + 2]
+        i += 2
+    return hex_str
+
+
+def legacy_to_str(byte_obj):
+    str_decodes = byte_obj.decode('latin-1')
+    hex_str = ''
+    for ch in str_decodes:
+        hex_str += hex(ord(ch))
+    return ''.join(['0' + el if len(el) == 1 else el for el in hex_str.split('0x')][1:])
+
+
+def measure(function, argument):
+    number = max(1, min(1000, (1 << 20) // len(argument)))
+    return timeit.timeit(lambda: function(argument), number=number) / number
+
+
+def human(size):
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return '{0} {1}'.format(size, unit)
+        size //= 1024
+    return '{0} GB'.format(size)
+
+
+def main():
+    print('{0:>8} {1:<26} {2:>14} {3:>14} {4:>9}'.format('size', 'function', 'old (ms)', 'new (ms)', 'speedup'))
+    for size in SIZES:
+        payload = os.urandom(size)
+        hex_str = ct.to_str(payload)
+        for name, legacy, new, argument in (('to_str', legacy_to_str, ct.to_str, payload),
+                                            ('simple_hex_to_formal_hex', legacy_simple_hex_to_formal_hex,
+                                             ct.simple_hex_to_formal_hex, hex_str)):
+            new_time = measure(new, argument)
+            if size <= LEGACY_LIMIT:
+                assert legacy(argument) == new(argument), 'different output in {0}'.format(name)
+                old_time = measure(legacy, argument)
+                print('{0:>8} {1:<26} {2:>14.3f} {3:>14.3f} {4:>8.1f}x'.format(
+                    human(size), name, old_time * 1000, new_time * 1000, old_time / new_time))
+            else:
+                print('{0:>8} {1:<26} {2:>14} {3:>14.3f} {4:>9}'.format(human(size), name, '-', new_time * 1000, '-'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmark of the deletion of TempData records: row by row (the old implementation of send_data and clean_data)
+against the set-based chunked deletion.
+
+Results (seconds) with Python 3.11, Django 1.11 and a temporary SQLite database:
+
+      rows row by row (s)   delete() (s) clean_data (s)
+      1000          0.707          0.009          0.019
+     10000          8.173          0.175          0.124
+    100000              -          1.042          1.482
+"""
+__author__ = 'macastro'
+
+import os
+import time
+
+from benchmarks import django_setup
+
+ROW_COUNTS = (1000, 10000, 100000)
+ROW_BY_ROW_LIMIT = 10000  # it is too slow for bigger tables
+
+
+def populate(rows):
+    from django.utils import timezone
+    from daemonsceleryapp.models import TempData
+    old_date = timezone.now() - timezone.timedelta(days=10)
+    TempData.objects.bulk_create(
+        [TempData(instrumentId='instr{0}'.format(n % 10), parameterName='param', user='user', content='0.0',
+                  queryDate=old_date) for n in range(rows)], batch_size=500)
+
+
+def row_by_row():
+    from daemonsceleryapp.models import TempData
+    for tempData in TempData.objects.all():
+        tempData.delete()
+
+
+def main():
+    path = django_setup.setup()
+    from daemonsceleryapp import tasks
+    from daemonsceleryapp.models import TempData
+    try:
+        print('{0:>10} {1:>14} {2:>14} {3:>14}'.format('rows', 'row by row (s)', 'delete() (s)', 'clean_data (s)'))
+        for rows in ROW_COUNTS:
+            results = []
+            if rows <= ROW_BY_ROW_LIMIT:
+                populate(rows)
+                start = time.time()
+                row_by_row()
+                results.append('{0:.3f}'.format(time.time() - start))
+            else:
+                results.append('-')
+
+            populate(rows)
+            start = time.time()
+            tasks.delete(TempData.objects.values_list('id', flat=True))
+            results.append('{0:.3f}'.format(time.time() - start))
+
+            populate(rows)
+            start = time.time()
+            tasks.clean_data(60)
+            results.append('{0:.3f}'.format(time.time() - start))
+            print('{0:>10} {1:>14} {2:>14} {3:>14}'.format(rows, *results))
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
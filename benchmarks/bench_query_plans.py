@@ -0,0 +1,77 @@
+"""
+Query plans and times of the queries of send_data and clean_data on TempData, without the indexes (migration
+daemonsceleryapp 0002) and with them (0003).
+"""
+__author__ = 'macastro'
+
+import os
+import time
+
+from benchmarks import django_setup
+
+ROWS = 200000
+INSTRUMENTS = 20
+REPEAT = 5
+
+
+def populate(rows):
+    from django.utils import timezone
+    from daemonsceleryapp.models import TempData
+    now = timezone.now()
+    TempData.objects.bulk_create(
+        [TempData(instrumentId='instr{0}'.format(n % INSTRUMENTS), parameterName='param', user='user', content='0.0',
+                  queryDate=now - timezone.timedelta(seconds=rows - n)) for n in range(rows)], batch_size=500)
+
+
+def queries():
+    """
+    :return: list of (name, queryset) with the queries of the tasks
+    """
+    from django.utils import timezone
+    from daemonsceleryapp import tasks
+    from daemonsceleryapp.models import TempData
+    now = timezone.now()
+    middle_id = TempData.objects.filter(instrumentId='instr7').order_by('id').values_list('id', flat=True)[ROWS // 40]
+    return [
+        ('distinct instruments', TempData.objects.values_list('instrumentId', flat=True).distinct()),
+        ('block (keyset)', tasks.pending_data(now).filter(instrumentId='instr7', id__gt=middle_id).order_by('id')
+            .values('id', 'instrumentId', 'parameterName', 'content', 'queryDate', 'attempts')[:50]),
+        ('old data (clean_data)', TempData.objects.filter(queryDate__lt=now - timezone.timedelta(seconds=ROWS // 2))
+            .values_list('id', flat=True)[:500]),
+    ]
+
+
+def explain(queryset):
+    from django.db import connection
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def measure(title):
+    print(title)
+    for name, queryset in queries():
+        start = time.time()
+        for _ in range(REPEAT):
+            list(queryset.all())
+        print('  {0:<24} {1:>10.2f} ms'.format(name, (time.time() - start) * 1000 / REPEAT))
+        for detail in explain(queryset):
+            print('      {0}'.format(detail))
+
+
+def main():
+    path = django_setup.setup()
+    from django.core.management import call_command
+    try:
+        call_command('migrate', 'daemonsceleryapp', '0002', verbosity=0, interactive=False)
+        populate(ROWS)
+        measure('Without indexes ({0} rows)'.format(ROWS))
+        call_command('migrate', 'daemonsceleryapp', verbosity=0, interactive=False)
+        measure('With indexes ({0} rows)'.format(ROWS))
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark of the uploads of send_data against a local stub server (HTTP/1.1 keep-alive, answers 201 Created after a
+simulated latency). It compares a new connection per block (bare requests.post) with the shared session of
+daemonsceleryapp.uploader, sending one block at a time and several blocks concurrently.
+
+Results with Python 3.11 (200 blocks of 15 records, 5 ms of latency):
+
+    mode                               window      seconds      records/s
+    new connection per block                1        1.573         1907.2
+    shared session (keep-alive)             1        1.407         2132.2
+    shared session (keep-alive)             4        0.521         5761.1
+    shared session (keep-alive)             8        0.500         6005.7
+"""
+__author__ = 'macastro'
+
+import json
+import os
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:  # python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+BLOCKS = 200
+RECORDS_PER_BLOCK = 15
+LATENCY = 0.005  # seconds simulated by the server for every request
+WINDOWS = (1, 4, 8)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(LATENCY)
+        self.send_response(201)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def build_block(block):
+    return {"instrumentContent": [{"content": "{0:.3f}".format(n * 0.1), "parameter": "temp", "idApp": "01",
+                                   "idCountry": "01", "instrumentName": "inst{0}".format(block),
+                                   "date": "2015-01-01T00:00:00"} for n in range(RECORDS_PER_BLOCK)],
+            "instrumentName": "inst{0}".format(block)}
+
+
+def measure(name, send, blocks, window=1):
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=window) as pool:
+        results = list(pool.map(send, blocks))
+    elapsed = time.time() - start
+    assert all(results), 'some blocks were not accepted'
+    print('{0:<32} {1:>8} {2:>12.3f} {3:>14.1f}'.format(name, window, elapsed,
+                                                       len(blocks) * RECORDS_PER_BLOCK / elapsed))
+
+
+def main():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'remoteinstr.settings')
+    import requests
+    from django.conf import settings
+    settings.SEND_DATA_MAX_IN_FLIGHT = max(WINDOWS)
+    from daemonsceleryapp import uploader
+
+    server = StubServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = 'http://127.0.0.1:{0}/createlist'.format(server.server_address[1])
+    blocks = [build_block(block) for block in range(BLOCKS)]
+
+    def bare_post(data):
+        response = requests.post(url, json.dumps(data), headers={'Content-Type': 'application/json',
+                                                                  'Connection': 'close'})
+        return response.status_code == requests.codes.created
+
+    def pooled_post(data):
+        return uploader.post_block(url, 'user', 'pass', data, 0)[0]
+
+    print('{0:<32} {1:>8} {2:>12} {3:>14}'.format('mode', 'window', 'seconds', 'records/s'))
+    measure('new connection per block', bare_post, blocks)
+    for window in WINDOWS:
+        measure('shared session (keep-alive)', pooled_post, blocks, window)
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,25 @@
+"""
+Setup of Django for the benchmarks, using a temporary SQLite database.
+"""
+__author__ = 'macastro'
+
+import os
+import tempfile
+
+
+def setup():
+    """
+    Configure Django with the settings of the project but a new temporary database, and create its tables.
+    :return: the path of the database file
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'remoteinstr.settings')
+    from django.conf import settings
+    handle, path = tempfile.mkstemp(suffix='.db', prefix='bench_')
+    os.close(handle)
+    settings.DATABASES['default']['NAME'] = path
+
+    import django
+    django.setup()
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0, interactive=False)
+    return path
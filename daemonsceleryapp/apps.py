@@ -0,0 +1,13 @@
+from __future__ import absolute_import
+
+__author__ = 'macastro'
+
+from django.apps import AppConfig
+
+
+class DaemonsCeleryAppConfig(AppConfig):
+    name = 'daemonsceleryapp'
+
+    def ready(self):
+        # connect the signal receivers (invalidation of the compiled plan of collect_data)
+        from daemonsceleryapp import signals
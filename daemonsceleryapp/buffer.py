@@ -0,0 +1,113 @@
+"""
+Buffer of the measurements collected by collect_data. The TempData rows are not saved one by one (one transaction per
+row on SQLite) but written together with bulk_create inside a single transaction, where the rollups of the
+measurements are updated too (see daemonsceleryapp.rollups).
+The buffer is flushed at the end of every cycle of collect_data (TEMPDATA_FLUSH_EACH_CYCLE) or when it has
+TEMPDATA_FLUSH_MAX_RECORDS rows or its oldest row is older than TEMPDATA_FLUSH_MAX_DELAY milliseconds. It is always
+flushed when the worker shuts down.
+"""
+from __future__ import absolute_import
+
+__author__ = 'macastro'
+
+import atexit
+import logging
+import threading
+import time
+
+from celery.signals import worker_process_shutdown, worker_shutdown
+from django.conf import settings
+from django.db import transaction
+from daemonsceleryapp.models import TempData
+from daemonsceleryapp.rollups import update_rollups
+
+# Get an instance of a logger
+logger = logging.getLogger(__name__)
+
+
+class MeasurementBuffer(object):
+    """
+    Thread safe buffer of TempData objects (not saved yet)
+    """
+    def __init__(self, max_records, max_delay):
+        '''
+        :param max_records: number of records that forces a flush
+        :param max_delay: seconds that a record can wait in the buffer before forcing a flush
+        '''
+        self.max_records = max_records
+        self.max_delay = max_delay
+        self.records = []
+        self.oldest = None
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()  # the rollups of two flushes must not be merged at the same time
+
+    def add(self, tempData):
+        """
+        Add a new record, flushing the buffer if the policy says so.
+        :param tempData: TempData object not saved
+        """
+        with self.lock:
+            if not self.records:
+                self.oldest = time.time()
+            self.records.append(tempData)
+        if self.is_full():
+            self.flush()
+
+    def is_full(self):
+        """
+        :return: True if the buffer has too many records or they have been waiting too long
+        """
+        with self.lock:
+            return bool(self.records) and (len(self.records) >= self.max_records or
+                                           time.time() - self.oldest >= self.max_delay)
+
+    def flush(self):
+        """
+        Write all the buffered records and update their rollups in a single transaction. If it fails the records are
+        kept for the next flush.
+        :return: the number of records written
+        """
+        with self.flush_lock:
+            return self.__flush()
+
+    def __flush(self):
+        with self.lock:
+            records, oldest = self.records, self.oldest
+            self.records, self.oldest = [], None
+        if not records:
+            return 0
+
+        try:
+            with transaction.atomic():
+                TempData.objects.bulk_create(records)
+                update_rollups(records)
+        except Exception as exc:
+            logger.error("Error writing {0} records of temporal data, they will be written later".format(len(records)))
+            logger.error(exc)
+            with self.lock:
+                self.records = records + self.records
+                self.oldest = oldest
+            return 0
+
+        logger.debug("{0} records of temporal data written".format(len(records)))
+        return len(records)
+
+
+# The buffer of this worker process
+measurement_buffer = MeasurementBuffer(
+    getattr(settings, 'TEMPDATA_FLUSH_MAX_RECORDS', 500),
+    getattr(settings, 'TEMPDATA_FLUSH_MAX_DELAY', 5000) / 1000.0
+)
+
+
+def flush_on_shutdown(**kwargs):
+    """
+    Receiver of the shutdown of the worker (and its pool processes), nothing buffered must be lost.
+    """
+    flushed = measurement_buffer.flush()
+    if flushed:
+        logger.info("{0} records of temporal data written on shutdown".format(flushed))
+
+worker_process_shutdown.connect(flush_on_shutdown, dispatch_uid='flush_measurements_process_shutdown')
+worker_shutdown.connect(flush_on_shutdown, dispatch_uid='flush_measurements_shutdown')
+atexit.register(flush_on_shutdown)
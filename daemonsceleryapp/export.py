@@ -0,0 +1,107 @@
+"""
+Streaming export of the measurements (TempData) as NDJSON or CSV, used by the export_measurements command and the
+export endpoint. The rows are read in blocks walking the primary key and written as they are read, so the memory
+used does not depend on the number of measurements exported.
+"""
+from __future__ import absolute_import
+
+__author__ = 'macastro'
+
+import csv
+import io
+import json
+import zlib
+
+from django.conf import settings
+from daemonsceleryapp.models import TempData
+
+FIELDS = ('id', 'instrumentId', 'parameterName', 'user', 'content', 'numericContent', 'unit', 'queryDate')
+FORMATS = ('ndjson', 'csv')
+CONTENT_TYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+
+def filter_measurements(instrumentId=None, parameter=None, start=None, end=None):
+    """
+    :return: queryset of TempData with the filters given
+    """
+    temps_data = TempData.objects.all()
+    if instrumentId:
+        temps_data = temps_data.filter(instrumentId=instrumentId)
+    if parameter:
+        temps_data = temps_data.filter(parameterName=parameter)
+    if start:
+        temps_data = temps_data.filter(queryDate__gte=start)
+    if end:
+        temps_data = temps_data.filter(queryDate__lt=end)
+    return temps_data
+
+
+def iter_rows(temps_data, block_size=None):
+    """
+    Read the rows in blocks of EXPORT_BLOCK_SIZE walking the primary key (id > last id ORDER BY id). Django 1.8 has no
+    server side cursors, so this keeps the memory bounded in every database backend.
+    :param temps_data: queryset of TempData
+    :return: generator of tuples with the FIELDS
+    """
+    block_size = block_size or getattr(settings, 'EXPORT_BLOCK_SIZE', 2000)
+    last_id = 0
+    while True:
+        rows = list(temps_data.filter(id__gt=last_id).order_by('id').values_list(*FIELDS)[:block_size])
+        if not rows:
+            return
+        for row in rows:
+            yield row
+        last_id = rows[-1][0]
+
+
+def iter_lines(rows, output_format):
+    """
+    :param rows: tuples with the FIELDS
+    :param output_format: 'ndjson' (a json object per line) or 'csv' (with header)
+    :return: generator of lines (str)
+    """
+    if output_format == 'ndjson':
+        for row in rows:
+            record = dict(zip(FIELDS, row))
+            record['queryDate'] = record['queryDate'].isoformat()
+            yield json.dumps(record, separators=(',', ':')) + '\n'
+    elif output_format == 'csv':
+        line = io.StringIO()
+        writer = csv.writer(line)
+        writer.writerow(FIELDS)
+        yield line.getvalue()
+        for row in rows:
+            line.seek(0)
+            line.truncate()
+            writer.writerow(row[:-1] + (row[-1].isoformat(),))
+            yield line.getvalue()
+    else:
+        raise ValueError('Format not supported: {0}'.format(output_format))
+
+
+def iter_export(temps_data, output_format, compress=False, chunk_size=65536):
+    """
+    Encode the export in chunks of about chunk_size bytes, compressed with gzip on the fly if it is asked.
+    :param temps_data: queryset of TempData (see filter_measurements)
+    :param output_format: 'ndjson' or 'csv'
+    :param compress: True to compress with gzip
+    :return: generator of bytes
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if compress else None
+    chunk = []
+    length = 0
+    for line in iter_lines(iter_rows(temps_data), output_format):
+        data = line.encode('utf-8')
+        chunk.append(data)
+        length += len(data)
+        if length >= chunk_size:
+            data = b''.join(chunk)
+            chunk, length = [], 0
+            data = compressor.compress(data) if compressor else data
+            if data:
+                yield data
+    data = b''.join(chunk)
+    if compressor:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
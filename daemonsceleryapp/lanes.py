@@ -0,0 +1,85 @@
+"""
+Lanes of collect_data. The instruments that share a physical device (backend + visaId) are collected one after
+another in the same lane and the lanes run in a thread pool that lives as long as the worker process. collect_data
+only dispatches the lanes and returns, so a slow lane never delays the next ticks nor the rest of the instruments.
+"""
+from __future__ import absolute_import
+
+__author__ = 'macastro'
+
+import logging
+import threading
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+
+# Get an instance of a logger
+logger = logging.getLogger(__name__)
+
+
+def lane_key(instrument):
+    """
+    :return: the key of the lane of an instrument, its physical device
+    """
+    return instrument.backend, instrument.visaId
+
+
+def group_lanes(instrument_plans):
+    """
+    :param instrument_plans: CompiledInstrument of the instruments to collect
+    :return: OrderedDict lane key -> list of CompiledInstrument, in the order given
+    """
+    lanes = OrderedDict()
+    for instrument_plan in instrument_plans:
+        lanes.setdefault(lane_key(instrument_plan.instrument), []).append(instrument_plan)
+    return lanes
+
+
+class LaneDispatcher(object):
+    """
+    Thread pool of the lanes (max_workers threads, created the first time it is used). A lane is never dispatched
+    again while it is still running or waiting for a thread, so a device is never polled twice at the same time and
+    the slow lanes do not pile up.
+    """
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self.executor = None
+        self.running = {}  # lane key -> Future
+        self.lock = threading.Lock()
+
+    def busy(self):
+        """
+        :return: set with the keys of the lanes running or waiting for a thread
+        """
+        with self.lock:
+            return set(key for key, future in self.running.items() if not future.done())
+
+    def dispatch(self, key, function, *args):
+        """
+        Run function(*args) in the pool as the lane key, unless that lane is busy.
+        :return: the Future of the lane, or None if it was busy
+        """
+        with self.lock:
+            current = self.running.get(key)
+            if current is not None and not current.done():
+                return None
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            future = self.executor.submit(function, *args)
+            self.running[key] = future
+        future.add_done_callback(lambda done: self.__finished(key, done))
+        return future
+
+    def join(self, timeout=None):
+        """
+        Wait for the lanes dispatched (tests and shutdown).
+        :return: True if all of them have finished
+        """
+        with self.lock:
+            futures = list(self.running.values())
+        return not wait(futures, timeout=timeout).not_done
+
+    def __finished(self, key, future):
+        with self.lock:
+            if self.running.get(key) is future:
+                del self.running[key]
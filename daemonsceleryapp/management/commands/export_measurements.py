@@ -0,0 +1,54 @@
+"""
+Export the measurements (TempData) to a file or to the standard output, e.g.
+
+    python manage.py export_measurements --format csv --instrument beagle-1 --start 2015-01-01 --gzip -o data.csv.gz
+"""
+__author__ = 'macastro'
+
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from daemonsceleryapp.export import FORMATS, filter_measurements, iter_export
+from remoteinstrapp.utils.dates import parse_date
+
+
+def parse(value):
+    """
+    :param value: ISO 8601 date or datetime (see remoteinstrapp.utils.dates.parse_date)
+    :return: the datetime (midnight for a date)
+    """
+    try:
+        return parse_date(value)
+    except ValueError as err:
+        raise CommandError(str(err))
+
+
+class Command(BaseCommand):
+    help = 'Export the measurements as NDJSON or CSV, streaming them (the memory used does not depend on the rows)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=FORMATS, default='ndjson', help='output format')
+        parser.add_argument('--instrument', help='instrumentId of the measurements')
+        parser.add_argument('--parameter', help='parameterName of the measurements')
+        parser.add_argument('--start', help='first date/datetime (included)')
+        parser.add_argument('--end', help='last date/datetime (excluded)')
+        parser.add_argument('--gzip', action='store_true', default=False, help='compress the output with gzip')
+        parser.add_argument('-o', '--output', help='file written (standard output by default)')
+
+    def handle(self, *args, **options):
+        temps_data = filter_measurements(
+            options['instrument'],
+            options['parameter'],
+            parse(options['start']) if options['start'] else None,
+            parse(options['end']) if options['end'] else None
+        )
+        output = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        try:
+            for data in iter_export(temps_data, options['format'], options['gzip']):
+                output.write(data)
+        finally:
+            if options['output']:
+                output.close()
+            else:
+                output.flush()
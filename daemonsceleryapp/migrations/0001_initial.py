@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TempData',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('instrumentId', models.CharField(max_length=50)),
+                ('parameterName', models.CharField(max_length=50)),
+                ('user', models.CharField(max_length=50)),
+                ('content', models.TextField()),
+                ('queryDate', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('daemonsceleryapp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tempdata',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tempdata',
+            name='nextAttempt',
+            field=models.DateTimeField(null=True, blank=True),
+        ),
+        migrations.AddField(
+            model_name='tempdata',
+            name='lastError',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('daemonsceleryapp', '0002_tempdata_outbox'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='tempdata',
+            name='instrumentId',
+            field=models.CharField(max_length=50, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='tempdata',
+            name='queryDate',
+            field=models.DateTimeField(db_index=True),
+        ),
+        migrations.AlterIndexTogether(
+            name='tempdata',
+            index_together=set([('instrumentId', 'id')]),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('daemonsceleryapp', '0003_tempdata_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tempdata',
+            name='numericContent',
+            field=models.FloatField(null=True, blank=True),
+        ),
+        migrations.AddField(
+            model_name='tempdata',
+            name='unit',
+            field=models.CharField(max_length=20, blank=True, default=''),
+        ),
+    ]
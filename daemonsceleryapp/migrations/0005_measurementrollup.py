@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('daemonsceleryapp', '0004_tempdata_numeric'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MeasurementRollup',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('instrumentId', models.CharField(max_length=50)),
+                ('parameterName', models.CharField(max_length=50)),
+                ('resolution', models.CharField(max_length=10, choices=[('minute', 'Minute'), ('hour', 'Hour')])),
+                ('bucket', models.DateTimeField()),
+                ('day', models.DateField(db_index=True)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total', models.FloatField(default=0.0)),
+                ('minimum', models.FloatField(null=True, blank=True)),
+                ('maximum', models.FloatField(null=True, blank=True)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='measurementrollup',
+            unique_together=set([('instrumentId', 'parameterName', 'resolution', 'bucket')]),
+        ),
+    ]
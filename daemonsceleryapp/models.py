@@ -9,14 +9,53 @@ class TempData(models.Model):
     Store the temporal data with the information of measurements
     @author: macastro
     """
-    instrumentId = models.CharField(max_length=50)
+    instrumentId = models.CharField(max_length=50, db_index=True)
     parameterName = models.CharField(max_length=50)
     user = models.CharField(max_length=50)
     content = models.TextField()
-    queryDate = models.DateTimeField()
+    numericContent = models.FloatField(null=True, blank=True)  # parsed content (see Task.parser)
+    unit = models.CharField(max_length=20, blank=True, default='')
+    queryDate = models.DateTimeField(db_index=True)  # clean_data
+    # state of the delivery to the external web service (send_data), the rows work as an outbox
+    attempts = models.PositiveIntegerField(default=0)
+    nextAttempt = models.DateTimeField(null=True, blank=True)
+    lastError = models.TextField(blank=True, default='')
+
+    class Meta:
+        # send_data walks the data of every instrument by id (see daemonsceleryapp.tasks.iter_blocks)
+        index_together = [('instrumentId', 'id')]
 
     def __str__(self):
         return '{0}'.format(self.instrumentId)
 
 
+class MeasurementRollup(models.Model):
+    """
+    Aggregates of the numeric measurements (TempData.numericContent) of a parameter of an instrument in a minute or an
+    hour. They are updated incrementally when the measurements are written (see daemonsceleryapp.rollups) and they are
+    kept much longer than the measurements. The day of the bucket allows removing whole days (see clean_rollups).
+    @author: macastro
+    """
+    RESOLUTION_CHOICES = (
+        ('minute', 'Minute'),
+        ('hour', 'Hour'),
+    )
+    instrumentId = models.CharField(max_length=50)
+    parameterName = models.CharField(max_length=50)
+    resolution = models.CharField(max_length=10, choices=RESOLUTION_CHOICES)
+    bucket = models.DateTimeField()  # start of the minute or hour
+    day = models.DateField(db_index=True)
+    count = models.PositiveIntegerField(default=0)
+    total = models.FloatField(default=0.0)
+    minimum = models.FloatField(null=True, blank=True)
+    maximum = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('instrumentId', 'parameterName', 'resolution', 'bucket')
 
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def __str__(self):
+        return '{0}:{1} {2} {3}'.format(self.instrumentId, self.parameterName, self.resolution, self.bucket)
@@ -0,0 +1,129 @@
+"""
+In-memory plan of the data collection. The whole active configuration (instruments -> tasks -> commands -> visa
+attributes, and the pyvisa parameters of the instruments) is loaded with a constant number of queries, no matter how
+many instruments, tasks or commands there are.
+The plan is compiled (see compile_plan) and cached by the worker. Any change in the configuration, done by this or by
+another process (the web service), invalidates it through the post_save/post_delete signals
+(see daemonsceleryapp.signals) and a version shared with the cache framework.
+"""
+from __future__ import absolute_import
+
+__author__ = 'macastro'
+
+import logging
+import threading
+import uuid
+
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.db.models import Prefetch
+from remoteinstrapp.models import Instrument, Task, Command
+from remoteinstrapp.app_management.executor import compile_command
+from remoteinstrapp.app_management.manager import resolve_attributes
+
+# Get an instance of a logger
+logger = logging.getLogger(__name__)
+
+# Key of the version of the configuration in the cache framework
+PLAN_VERSION_KEY = 'daemonsceleryapp.plan.version'
+
+# An instrument with its active tasks. Only tasks with commands are included
+InstrumentPlan = namedtuple('InstrumentPlan', ['instrument', 'tasks'])
+
+# A task with its commands in seqNumber order
+TaskPlan = namedtuple('TaskPlan', ['task', 'commands'])
+
+# An instrument with its pyvisa parameters resolved and its compiled tasks
+CompiledInstrument = namedtuple('CompiledInstrument', ['instrument', 'parameters', 'tasks'])
+
+# The fields of a task needed to execute and store it, with its commands compiled (see executor.CompiledCommand)
+CompiledTask = namedtuple('CompiledTask', ['taskId', 'parameterName', 'user', 'retries', 'parser', 'unit',
+                                           'commands'])
+
+_compiled = {'version': None, 'plan': None}
+_lock = threading.Lock()
+
+
+def load_plan():
+    """
+    Load the active configuration from database.
+    :return: list of InstrumentPlan
+    """
+    commands = Command.objects.order_by('seqNumber').prefetch_related(
+        'visaAttributes_numeric',
+        'visaAttributes_string'
+    )
+    tasks = Task.objects.filter(active=True).prefetch_related(
+        Prefetch('commands', queryset=commands, to_attr='ordered_commands')
+    )
+    instruments = Instrument.objects.filter(
+        active=True,
+        tasks__isnull=False,
+        tasks__active=True
+    ).distinct().prefetch_related(  # This query executes a distinct command
+        'pyvisaParameters_numeric',
+        'pyvisaParameters_string',
+        Prefetch('tasks', queryset=tasks, to_attr='active_tasks')
+    )
+
+    plan = []
+    for instrument in instruments:
+        task_plans = [TaskPlan(task, task.ordered_commands) for task in instrument.active_tasks if task.ordered_commands]
+        if task_plans:
+            plan.append(InstrumentPlan(instrument, task_plans))
+    return plan
+
+
+def compile_plan(plans):
+    """
+    Compile a plan loaded by load_plan. The tasks with a wrong configuration (e.g. an unknown pyvisa constant) are
+    left out of the plan and reported in the log.
+    :param plans: list of InstrumentPlan
+    :return: tuple of CompiledInstrument
+    """
+    compiled = []
+    for instrument, task_plans in plans:
+        try:
+            parameters = resolve_attributes(instrument.pyvisaParameters_numeric.all(),
+                                            instrument.pyvisaParameters_string.all())
+        except Exception as excep:
+            logger.error("The parameters of the instrument {0} are wrong, it will not be polled: {1}"
+                         .format(instrument.instrumentId, excep))
+            continue
+
+        tasks = []
+        for task, commands in task_plans:
+            try:
+                tasks.append(CompiledTask(task.taskId, task.parameterName, task.user, task.retries, task.parser,
+                                          task.unit, tuple(compile_command(command) for command in commands)))
+            except Exception as excep:
+                logger.error("The task {0} of the instrument {1} is wrong, it will not be executed: {2}"
+                             .format(task.taskId, instrument.instrumentId, excep))
+        if tasks:
+            compiled.append(CompiledInstrument(instrument, parameters, tuple(tasks)))
+    return tuple(compiled)
+
+
+def get_compiled_plan():
+    """
+    Return the compiled plan of this process, loading and compiling it again only if the configuration has changed.
+    :return: tuple of CompiledInstrument
+    """
+    version = cache.get(PLAN_VERSION_KEY)
+    with _lock:
+        if _compiled['plan'] is None or _compiled['version'] != version:
+            logger.info("Compiling the collection plan")
+            _compiled['plan'] = compile_plan(load_plan())
+            _compiled['version'] = version
+        return _compiled['plan']
+
+
+def invalidate_plan(**kwargs):
+    """
+    Discard the compiled plan of this process and of the rest of processes that share the cache.
+    It has the signature of a signal receiver.
+    """
+    cache.set(PLAN_VERSION_KEY, uuid.uuid4().hex, None)
+    with _lock:
+        _compiled['plan'] = None
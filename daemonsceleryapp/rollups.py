@@ -0,0 +1,136 @@
+"""
+Minute and hour rollups (count, sum, min, max) of the numeric measurements of every (instrumentId, parameterName).
+They are updated incrementally with every batch of measurements written by the buffer (see
+daemonsceleryapp.buffer), so no query has to aggregate the raw measurements.
+"""
+from __future__ import absolute_import
+
+__author__ = 'macastro'
+
+import logging
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce, Greatest, Least
+from daemonsceleryapp.models import MeasurementRollup
+
+# Get an instance of a logger
+logger = logging.getLogger(__name__)
+
+RESOLUTIONS = ('minute', 'hour')
+
+
+def bucket_start(date, resolution):
+    """
+    :param date: datetime of a measurement
+    :param resolution: 'minute' or 'hour'
+    :return: the start of the bucket of the date
+    """
+    if resolution == 'minute':
+        return date.replace(second=0, microsecond=0)
+    if resolution == 'hour':
+        return date.replace(minute=0, second=0, microsecond=0)
+    raise ValueError('Resolution not supported: {0}'.format(resolution))
+
+
+def aggregate(records):
+    """
+    Aggregate a batch of measurements in memory.
+    :param records: TempData objects, the ones without numericContent are ignored
+    :return: dict (instrumentId, parameterName, resolution, bucket) -> [count, total, minimum, maximum]
+    """
+    partial = {}
+    for record in records:
+        value = record.numericContent
+        if value is None:
+            continue
+        for resolution in RESOLUTIONS:
+            key = (record.instrumentId, record.parameterName, resolution, bucket_start(record.queryDate, resolution))
+            current = partial.get(key)
+            if current is None:
+                partial[key] = [1, value, value, value]
+            else:
+                current[0] += 1
+                current[1] += value
+                current[2] = min(current[2], value)
+                current[3] = max(current[3], value)
+    return partial
+
+
+def update_rollups(records):
+    """
+    Merge a batch of measurements in the rollups. It must be called inside the transaction that writes the
+    measurements, so both are written or none. The existing rollups are updated in the database (count = count + n...),
+    so two workers flushing the same bucket do not lose updates, and the new ones are created in a savepoint: if
+    another worker has created any of them meanwhile (there is no row locking on SQLite) they are merged one by one.
+    :param records: TempData objects
+    :return: the number of rollups created or updated
+    """
+    partial = aggregate(records)
+    if not partial:
+        return 0
+
+    existing = existing_keys(partial)
+    new_keys = [key for key in partial if key not in existing]
+    try:
+        with transaction.atomic():
+            MeasurementRollup.objects.bulk_create([new_rollup(key, partial[key]) for key in new_keys])
+    except IntegrityError:
+        logger.debug("Rollups created by another worker, merging them one by one")
+        for key in new_keys:
+            upsert_rollup(key, partial[key])
+    for key in partial:
+        if key in existing:
+            upsert_rollup(key, partial[key])
+    return len(partial)
+
+
+def existing_keys(partial):
+    """
+    :param partial: dict returned by aggregate
+    :return: set of the keys of partial whose rollups exist
+    """
+    existing = MeasurementRollup.objects.filter(
+        instrumentId__in=set(key[0] for key in partial),
+        bucket__in=set(key[3] for key in partial)
+    ).values_list('instrumentId', 'parameterName', 'resolution', 'bucket')
+    return set(existing) & set(partial)
+
+
+def new_rollup(key, values):
+    instrumentId, parameterName, resolution, bucket = key
+    count, total, minimum, maximum = values
+    return MeasurementRollup(instrumentId=instrumentId, parameterName=parameterName, resolution=resolution,
+                             bucket=bucket, day=bucket.date(), count=count, total=total, minimum=minimum,
+                             maximum=maximum)
+
+
+def merge_rollup(key, values):
+    """
+    Add the aggregates of values to the rollup of key with a single UPDATE.
+    :return: True if the rollup exists
+    """
+    instrumentId, parameterName, resolution, bucket = key
+    count, total, minimum, maximum = values
+    return MeasurementRollup.objects.filter(
+        instrumentId=instrumentId, parameterName=parameterName, resolution=resolution, bucket=bucket
+    ).update(
+        count=F('count') + count,
+        total=F('total') + total,
+        minimum=Least(Coalesce(F('minimum'), Value(minimum)), Value(minimum)),
+        maximum=Greatest(Coalesce(F('maximum'), Value(maximum)), Value(maximum))
+    ) > 0
+
+
+def upsert_rollup(key, values):
+    """
+    Merge values in the rollup of key, creating it if it does not exist yet (UPDATE, INSERT if no row was updated and
+    UPDATE again if another worker has inserted it in between).
+    """
+    if merge_rollup(key, values):
+        return
+    try:
+        with transaction.atomic():
+            new_rollup(key, values).save(force_insert=True)
+    except IntegrityError:
+        merge_rollup(key, values)
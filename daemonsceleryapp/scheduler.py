@@ -0,0 +1,83 @@
+"""
+Scheduler of the instruments polled by collect_data. Every instrument is polled at its own Instrument.taskInterval
+(milliseconds) while collect_data is executed by celery beat at a short fixed period (COLLECT_DATA_TICK).
+"""
+from __future__ import absolute_import
+
+__author__ = 'macastro'
+
+import heapq
+import logging
+import threading
+import time
+
+# Get an instance of a logger
+logger = logging.getLogger(__name__)
+
+
+class InstrumentScheduler(object):
+    """
+    Heap of next due times, one entry per instrument. The entries of instruments that change their interval or
+    disappear from the configuration are not removed from the heap, they are skipped when they reach the top.
+    """
+    def __init__(self):
+        self.heap = []
+        self.entries = {}  # instrumentId -> (due time, interval in seconds)
+        self.lock = threading.Lock()
+
+    def due(self, instruments, now=None, busy=()):
+        """
+        Select the instruments that have to be polled now and schedule their next poll.
+        :param instruments: the active instruments (Instrument objects)
+        :param now: current time in seconds (time.time() by default)
+        :param busy: instrumentIds that cannot be polled now (their lane is still running). They keep their due time,
+        so they are selected as soon as they are not busy
+        :return: the list of instruments whose interval has elapsed, the most overdue first
+        """
+        now = time.time() if now is None else now
+        by_id = dict((instrument.instrumentId, instrument) for instrument in instruments)
+        with self.lock:
+            self.__sync(by_id, now)
+            result = []
+            deferred = []
+            while self.heap and self.heap[0][0] <= now:
+                due, instrumentId = heapq.heappop(self.heap)
+                entry = self.entries.get(instrumentId)
+                if entry is None or entry[0] != due:  # stale entry
+                    continue
+                if instrumentId in busy:
+                    deferred.append((due, instrumentId))
+                    continue
+                interval = entry[1]
+                next_due = due + interval
+                if next_due <= now:  # we were late (slow cycle), we do not try to catch up
+                    next_due = now + interval
+                self.__schedule(instrumentId, next_due, interval)
+                result.append(by_id[instrumentId])
+            for item in deferred:
+                heapq.heappush(self.heap, item)
+        return result
+
+    def __sync(self, by_id, now):
+        for instrumentId in list(self.entries):
+            if instrumentId not in by_id:
+                del self.entries[instrumentId]
+        for instrumentId, instrument in by_id.items():
+            interval = max(instrument.taskInterval or 0, 0) / 1000.0
+            entry = self.entries.get(instrumentId)
+            if entry is None:  # new instruments are polled right now
+                self.__schedule(instrumentId, now, interval)
+            elif entry[1] != interval:
+                logger.debug("Interval of {0} changed to {1} s".format(instrumentId, interval))
+                self.__schedule(instrumentId, min(entry[0], now + interval), interval)
+        if len(self.heap) > 2 * len(self.entries) + 16:  # too many stale entries
+            self.heap = [(due, instrumentId) for instrumentId, (due, interval) in self.entries.items()]
+            heapq.heapify(self.heap)
+
+    def __schedule(self, instrumentId, due, interval):
+        self.entries[instrumentId] = (due, interval)
+        heapq.heappush(self.heap, (due, instrumentId))
+
+
+# The scheduler of this worker process
+scheduler = InstrumentScheduler()
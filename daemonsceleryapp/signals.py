@@ -0,0 +1,17 @@
+"""
+Signal receivers of daemonsceleryapp. Any change in the configuration of the instruments invalidates the compiled
+plan used by collect_data.
+"""
+from __future__ import absolute_import
+
+__author__ = 'macastro'
+
+from django.db.models.signals import post_save, post_delete
+from remoteinstrapp.models import Instrument, PyVisaParameter_Numeric, PyVisaParameter_String, Task, Command, \
+    VisaAtributes_Numeric, VisaAttributes_String
+from daemonsceleryapp.plan import invalidate_plan
+
+for model in (Instrument, PyVisaParameter_Numeric, PyVisaParameter_String, Task, Command,
+              VisaAtributes_Numeric, VisaAttributes_String):
+    post_save.connect(invalidate_plan, sender=model, dispatch_uid='invalidate_plan_save_{0}'.format(model.__name__))
+    post_delete.connect(invalidate_plan, sender=model, dispatch_uid='invalidate_plan_delete_{0}'.format(model.__name__))
@@ -3,35 +3,31 @@ from __future__ import absolute_import
 __author__ = 'macastro'
 
 import logging
-import requests
-import json
+import time
 
-from requests.auth import HTTPBasicAuth
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 from celery import shared_task
+from celery.signals import worker_process_shutdown
+from django.db import connection
+from django.db.models import Q
 from django.utils import timezone
 from django.conf import settings
-from remoteinstrapp.models import Instrument, Config
-from remoteinstrapp.serializers import CommandSerializer
-from remoteinstrapp.app_management import manager
-from daemonsceleryapp.models import TempData
+from remoteinstrapp.models import Config
+from remoteinstrapp.app_management.executor import TaskExecutor
+from remoteinstrapp.utils import convert_tools as ct
+from daemonsceleryapp.models import TempData, MeasurementRollup
+from daemonsceleryapp.buffer import measurement_buffer
+from daemonsceleryapp.plan import get_compiled_plan
+from daemonsceleryapp.scheduler import scheduler
+from daemonsceleryapp.lanes import LaneDispatcher, group_lanes, lane_key
+from daemonsceleryapp.uploader import post_block, get_block_sizer, get_circuit_breaker
 
 # Get an instance of a logger
 logger = logging.getLogger(__name__)
 
-# Map for choose the correct manager
-callable_manager_map = {
-        'query_raw': manager.QueryRawInstrumentManager,
-        'query': manager.QueryInstrumentManager,
-        'write_raw': manager.WriteRawCommandManager,
-        'read_raw': manager.ReadRawCommandManager,
-        'read':manager.ReadCommandManager,
-        'write':manager.WriteCommandManager,
-        'get_visa_attribute':manager.GetVisaAttributeCommandManager
-
-    }
-
-
+# The lanes of collect_data of this worker process
+lane_dispatcher = LaneDispatcher(getattr(settings, 'COLLECT_DATA_MAX_WORKERS', 8))
 
 
 
@@ -47,64 +43,129 @@ def collect_data():
     in turn belongs to a specific instrument.
     A number of retries is also defined in a task level and it is used in case of any command fails
     inside of a task. In this case all the commands associated to a task are executed again from scratch.
+    The instrument is opened only once and all its tasks run on the same session
+    (see <code>remoteinstrapp.app_management.executor.TaskExecutor</code>).
+    The instruments are collected in parallel (COLLECT_DATA_MAX_WORKERS threads) with one lane per physical
+    instrument (backend + visaId), so a slow instrument does not stall the rest and the commands sent to the same
+    device are never mixed. The lanes run in a thread pool of the worker process (see
+    <code>daemonsceleryapp.lanes</code>): the task dispatches them and returns without waiting for them, and a lane
+    still running from a previous tick is not dispatched again.
+    The task is executed every COLLECT_DATA_TICK seconds but every instrument is only polled when its taskInterval
+    has elapsed (see <code>daemonsceleryapp.scheduler</code>). The instruments of a busy lane stay due and they are
+    polled at the first tick after their lane finishes.
+    The measurements of the lanes finished since the previous tick are written together at every tick.
     """
-    logger.info("Starting collect_data task")
+    logger.debug("Starting collect_data task")
     logger.debug("Task id {0.id}".format(collect_data.request))
-    instruments = Instrument.objects.filter(
-        active=True,
-        tasks__isnull=False,
-        tasks__active=True
-    ).distinct()  # This query executes a distinct command
-    for instrument in instruments:
-        # we catch all its tasks
-        logger.debug("Iterating over instrument {0}".format(instrument.instrumentId))
-
-        tasks = instrument.tasks.filter(active=True,commands__isnull=False).distinct()
-        for task in tasks:
-            retries = -1 # counter of retries, if we talk of tries should be 0
-            commands = task.commands.all().order_by('seqNumber')
-            success = False
+    if getattr(settings, 'TEMPDATA_FLUSH_EACH_CYCLE', True) or measurement_buffer.is_full():
+        measurement_buffer.flush()
+
+    plans = get_compiled_plan()  # all the active configuration, only loaded again when it changes
+    busy_lanes = lane_dispatcher.busy()
+    busy = set(p.instrument.instrumentId for p in plans if lane_key(p.instrument) in busy_lanes)
+    due = set(instrument.instrumentId for instrument in scheduler.due([p.instrument for p in plans], busy=busy))
+    if busy:
+        logger.debug("{0} instruments are waiting for their lanes: {1}".format(len(busy), sorted(busy)))
+    lanes = group_lanes([p for p in plans if p.instrument.instrumentId in due])
+    if not lanes:
+        logger.debug("There is not any instrument to poll, skipping the cycle")
+        return
+
+    for key, instrument_plans in lanes.items():
+        if lane_dispatcher.dispatch(key, collect_lane, instrument_plans) is None:
+            logger.warning("The lane of {0} is still busy, skipping it".format(key[1]))
 
+
+def join_lanes_on_shutdown(**kwargs):
+    """
+    Receiver of the shutdown of the worker process, the lanes running are waited for (COLLECT_DATA_SHUTDOWN_WAIT
+    seconds at most) and their measurements written.
+    """
+    if not lane_dispatcher.join(getattr(settings, 'COLLECT_DATA_SHUTDOWN_WAIT', 30)):
+        logger.warning("Some lanes of collect_data have not finished before the shutdown")
+    measurement_buffer.flush()
+
+worker_process_shutdown.connect(join_lanes_on_shutdown, dispatch_uid='join_lanes_process_shutdown')
+
+
+def collect_lane(instrument_plans):
+    """
+    Collect the data of the instruments that share a physical device, one after another. It runs in a thread of
+    the lane dispatcher so the database connection of the thread is closed at the end.
+    :param instrument_plans: list of CompiledInstrument whose instruments have the same backend and visaId
+    :return: list of tuples (instrumentId, elapsed seconds, tasks stored, tasks executed)
+    """
+    start = time.time()
+    try:
+        summary = [collect_instrument(instrument_plan) for instrument_plan in instrument_plans]
+    except Exception as excep:
+        logger.error("Error collecting the lane of {0}: {1}".format(instrument_plans[0].instrument.visaId, excep))
+        raise
+    finally:
+        connection.close()
+    logger.info("Lane of {0} collected in {1:.3f} s".format(instrument_plans[0].instrument.visaId,
+                                                             time.time() - start))
+    for instrumentId, elapsed, stored, total in summary:
+        logger.info(" - {0}: {1:.3f} s, {2}/{3} tasks stored".format(instrumentId, elapsed, stored, total))
+    return summary
+
+
+def collect_instrument(instrument_plan):
+    """
+    Execute all the active tasks of an instrument and store the result of the tasks that went well, with its numeric
+    value if the task has a parser.
+    :param instrument_plan: CompiledInstrument with the instrument and its tasks (see daemonsceleryapp.plan)
+    :return: a tuple (instrumentId, elapsed seconds, tasks stored, tasks executed)
+    """
+    start = time.time()
+    stored = 0
+    instrument, parameters, tasks = instrument_plan
+    logger.debug("Iterating over instrument {0}".format(instrument.instrumentId))
+    try:  # the instrument is opened only once for all its tasks
+        executor = TaskExecutor(instrument.instrumentId, instrument=instrument, parameters=parameters)
+    except Exception as excep:
+        logger.error(" Error opening the instrument {0}, skipping its tasks".format(instrument.instrumentId))
+        logger.error(str(excep))
+        return instrument.instrumentId, time.time() - start, stored, len(tasks)
+
+    try:
+        for task in tasks:
             logger.info("Executing task {0} for the instrument {1} ".format(task.taskId, instrument.instrumentId))
-            while not success and retries < task.retries:
-                c = 0
-                response = None
-                success = commands.exists()
-                if not success:
-                    logger.warning("There is not any command for this task, please review your configuration")
-                while c < commands.count() and success:
-                    command = commands[c]
-                    try:
-                        logger.debug("- Executing command {0}:{1}".format(command.commandId,command.method))
-                        manager = callable_manager_map[command.method](instrument.instrumentId)
-                        manager.setVisaAttributesFromTask(command)
-                        response=manager.execute_command(CommandSerializer(command).data)
-                        logger.debug(response.response_data)
-
-                        success = response.response_data['state'] == 'success'
-                        logger.debug("- Executing command {0}:{1}".format(command.commandId,command.method))
-                        if not success:
-                            raise Exception("ERROR: misunderstanding in the commands sent")
-                    except Exception as excep:
-                        logger.error(" Error during execution over:instrument {0} --> task{1} -->in command {2}, attempt {3}"
-                                     .format(instrument.instrumentId,task.taskId, command.method, retries+2))
-                        logger.error(str(excep))
-                        success = False
-
-                    c+=1
-
-                if success:  # store the last result of the command if it went well
-                    logger.debug("The command execution was OK!")
-                    tempData = TempData(
-                        instrumentId=command.task.instrument.instrumentId,
-                        parameterName=command.task.parameterName,
-                        user=command.task.user,
-                        content=response.response_data['result'],
-                        queryDate=timezone.now()
-                    )
-                    tempData.save()
-
-                retries += 1 # add a new attempt
+            response = executor.run(task, task.commands)
+
+            if response is not None:  # store the last result of the command if it went well
+                logger.debug("The command execution was OK!")
+                content = response.response_data['result']
+                measurement_buffer.add(TempData(
+                    instrumentId=instrument.instrumentId,
+                    parameterName=task.parameterName,
+                    user=task.user,
+                    content=content,
+                    numericContent=parse_content(content, task),
+                    unit=task.unit,
+                    queryDate=timezone.now()
+                ))
+                stored += 1
+    finally:
+        executor.close()
+
+    return instrument.instrumentId, time.time() - start, stored, len(tasks)
+
+
+def parse_content(content, task):
+    """
+    Numeric value of the result of a task (see convert_tools.parse_number).
+    :param content: the result of the last command of the task
+    :param task: the CompiledTask
+    :return: the number as float or None if the task has not parser or the result is not a number
+    """
+    try:
+        number = ct.parse_number(str(content), task.parser)
+        return None if number is None else float(number)
+    except (ValueError, OverflowError):
+        logger.warning("The result of the task {0} is not a valid number for the parser {1}: {2}"
+                       .format(task.taskId, task.parser, content))
+        return None
 
 
 ############################
@@ -123,107 +184,77 @@ def send_data(_url='http://lifewatch.viavansi.com/lifewatch-service-rest/instrum
     the remote server should return the ids that have been processed.
     Only the records that were not able to be sent will remain in temporal data table,
     the rest should be removed from database.
+    The blocks are read walking the primary key (id > last id sent ORDER BY id), so only one block is in memory and
+    exactly the records that were sent are deleted.
+
+    TempData works as an outbox: when a block fails its records are not sent again until their backoff has elapsed
+    (SEND_DATA_BACKOFF_BASE seconds doubled after every failed attempt, up to SEND_DATA_BACKOFF_MAX), and after
+    SEND_DATA_MAX_ATTEMPTS attempts they are not sent any more (clean_data removes them). The number of attempts, the
+    time of the next attempt and the last error are stored in the records.
+    If the external url keeps failing its circuit breaker is opened and nothing is sent to it for a while
+    (see uploader.CircuitBreaker).
+
+    Unless SEND_DATA_ADAPTIVE_BLOCKS is disabled the size of the blocks adapts to the latency and errors of the external
+    server (see uploader.AdaptiveBlockSizer).
 
     :param _url: the external url where the data will ben sent to
     :param limit: number of records per block when we make a petition to the url. It looks like a pagination...
+    It is the initial size if the size of the blocks is adaptive.
 
     """
     logger.info("Starting send_data task")
     # We get the configuration from remoteinstrapp database. Only one row ..
     config = Config.objects.all()[0]
 
-    instruments_ids_lisf_of_map = TempData.objects.values('instrumentId').distinct()
+    breaker = get_circuit_breaker(_url)
+    if not breaker.allow():
+        logger.warning("The circuit of {0} is open, skipping the cycle".format(_url))
+        return
+
+    now = timezone.now()
+    pending = pending_data(now)
+    instruments_ids = list(pending.values_list('instrumentId', flat=True).distinct())
 
-    total_number_of_temp_data = TempData.objects.count()
-    logger.info("Trying to send all the records ({0}) of TempData ".format(total_number_of_temp_data))
+    total_number_of_temp_data = pending.count()
+    logger.info("Trying to send all the pending records ({0}) of TempData ".format(total_number_of_temp_data))
 
-    if not instruments_ids_lisf_of_map.exists():
+    if not instruments_ids:
         logger.info("There is not temporal data to send, skipping the cycle")
         return
 
-    for el in instruments_ids_lisf_of_map:
-        instrumentId = el['instrumentId']
-        temps_data = TempData.objects.filter(instrumentId=instrumentId)
-
-        j = 0  # data are split into blocks of limit size as maximum
-        block = 0
-        proc_and_deleted = 0
-        logger.debug("page limit = {0} from {1} to {2}".format(limit,j,j+limit))
-        while j + limit < len(temps_data):
-
-            block += 1
-            logger.debug(">>  block {0}".format(block))
-            # we convert the data into dict notation for using json later
-            data_to_be_sent = convert_data_to_dict(temps_data[j:j + limit], config)
-            response = None
-            try:
-                final_data  = json.dumps(data_to_be_sent)
-                logger.debug(">>  final_data {0}".format(final_data))
-                response = requests.post(_url,final_data,auth=HTTPBasicAuth(USER,PASS),
-                                         headers={'Content-Type': 'application/json'})
-
-                logger.debug(">>  response {0}".format(response))
-                logger.debug(">>  content {0}".format(response.content))
-            except ConnectionError as exc:
-                logger.error("Error during connection with external URL for block {0} of data".format(block))
-                logger.error(exc)
-            except Exception as exc:
-                logger.error("Error during connection with external URL for block {0} of data".format(block))
-                logger.error(exc)
-
-            if response and response.status_code == requests.codes.created:
-                try:
-                    # we remove all the data that have been successfully processed
-                    deleted_records = delete(temps_data[j:j + limit])
-                    logger.debug(
-                        " Request OK for the block {0} .It has been deleted {1} records after this sending".format(
-                            block, deleted_records))
-                    proc_and_deleted += deleted_records
-                except ValueError as exc:
-                    logger.error("The format of the data returned by the external server is not expected")
-                    logger.error(exc)
-
-                except Exception as exc:
-                    logger.error("The format of the data returned by the external server is not expected")
-                    logger.error(exc)
-
-            j += limit
-
-        # the process is repeated for the last records that remain in the last block
-        block +=1
-        logger.debug("page limit = {0} from {1} to {2}".format(limit,j,len(temps_data)))
-        data_to_be_sent = convert_data_to_dict(temps_data[j:], config)
-        response = None
-        try:
-            final_data  = json.dumps(data_to_be_sent)
-            logger.debug(">>  final_data {0}".format(final_data))
-            response = requests.post(_url,json.dumps(data_to_be_sent),auth=HTTPBasicAuth(USER,PASS),
-                                     headers={'Content-Type': 'application/json'})
-
-        except ConnectionError as exc:
-            logger.error("Error during connection with external URL for block {0} of data".format(block))
-            logger.error(exc)
-
-        except Exception as exc:
-            logger.error("Error during connection with external URL for block {0} of data".format(block))
-            logger.error(exc)
-
-        if response and response.status_code == requests.codes.created:
-            try:
-                deleted_records = delete(temps_data[j:j + limit])
-                logger.debug(
-                        " Request OK for the block {0} .It has been deleted {1} records after this sending".format(
-                            block, deleted_records))
-                proc_and_deleted += deleted_records
-            except ValueError as exc:
-                logger.error("The format of the data returned by the external server is not expected")
-                logger.error(exc)
-            except Exception as exc:
-                logger.error("The format of the data returned by the external server is not expected")
-                logger.error(exc)
-
+    convert = convert_data_to_columns if getattr(settings, 'SEND_DATA_PAYLOAD_FORMAT', 'records') == 'columnar' \
+        else convert_data_to_dict
+    start = time.time()
+    proc_and_deleted = 0
+    sizer = get_block_sizer(_url, limit)
+    sizes = []
+    max_in_flight = max(getattr(settings, 'SEND_DATA_MAX_IN_FLIGHT', 1), 1)
+    blocks = (temps_data for instrumentId in instruments_ids for temps_data in iter_blocks(instrumentId, sizer, now))
+    # up to max_in_flight blocks are being sent at the same time, the database is only used by this thread
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        in_flight = {}
+        for block, temps_data in enumerate(blocks, 1):
+            if not breaker.allow():
+                logger.warning("The circuit of {0} has been opened, the rest of blocks are not sent".format(_url))
+                break
+            logger.debug(">>  block {0} of {1}: ids from {2} to {3}".format(
+                block, temps_data[0]['instrumentId'], temps_data[0]['id'], temps_data[-1]['id']))
+            sizes.append(len(temps_data))
+            future = pool.submit(send_block, _url, USER, PASS, convert(temps_data, config), block)
+            in_flight[future] = (block, temps_data)
+            if len(in_flight) >= max_in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                proc_and_deleted += finish_blocks(done, in_flight, sizer, breaker)
+        proc_and_deleted += finish_blocks(wait(in_flight)[0], in_flight, sizer, breaker)
+
+    elapsed = time.time() - start
     logger.info("{0} records of temporal data were deleted from database in this execution of this task"
                 .format(proc_and_deleted))
+    logger.info("send_data sent {0} records in {1:.3f} s ({2:.1f} records/s)"
+                .format(proc_and_deleted, elapsed, proc_and_deleted / elapsed if elapsed else 0.0))
+    if sizes:
+        logger.info("Block sizes of this cycle: {0} blocks, from {1} to {2} records, next size {3}"
+                    .format(len(sizes), min(sizes), max(sizes), sizer()))
 
     if total_number_of_temp_data != proc_and_deleted:
         logger.warning("The amount of records deleted should be the same that the "\
@@ -232,9 +263,117 @@ def send_data(_url='http://lifewatch.viavansi.com/lifewatch-service-rest/instrum
     # END
 
 
+def pending_data(now=None):
+    """
+    Temporal data that has to be sent: records that have not reached SEND_DATA_MAX_ATTEMPTS and whose backoff
+    has elapsed.
+    :param now: current datetime (timezone.now() by default)
+    :return: a queryset of TempData
+    """
+    now = now or timezone.now()
+    return TempData.objects.filter(
+        Q(nextAttempt__isnull=True) | Q(nextAttempt__lte=now),
+        attempts__lt=getattr(settings, 'SEND_DATA_MAX_ATTEMPTS', 10)
+    )
+
+
+def iter_blocks(instrumentId, limit, now=None):
+    """
+    Walk the pending temporal data of an instrument in blocks, using the primary key as cursor (keyset pagination),
+    so the cost of every block is the same no matter how far we are and the memory used is only one block.
+    :param instrumentId: the instrument whose data are read
+    :param limit: maximum number of records per block, or a callable that returns it before every block
+    :param now: current datetime, to know which records are still waiting for their backoff (see pending_data)
+    :return: generator of lists of dicts (values of TempData) ordered by id
+    """
+    pending = pending_data(now)
+    last_id = 0
+    while True:
+        size = limit() if callable(limit) else limit
+        temps_data = list(pending.filter(instrumentId=instrumentId, id__gt=last_id).order_by('id')
+                          .values('id', 'instrumentId', 'parameterName', 'content', 'queryDate',
+                                  'attempts')[:size])
+        if not temps_data:
+            return
+        yield temps_data
+        last_id = temps_data[-1]['id']
+
+
+def send_block(_url, USER, PASS, data_to_be_sent, block):
+    """
+    Send a block (see uploader.post_block) measuring the time spent.
+    :return: a tuple (True if the block was accepted, description of the error or None, seconds)
+    """
+    start = time.time()
+    success, error = post_block(_url, USER, PASS, data_to_be_sent, block)
+    return success, error, time.time() - start
+
+
+def finish_blocks(done, in_flight, sizer, breaker):
+    """
+    Remove from the database the records of the blocks that have been sent successfully and record a failed attempt
+    in the records of the rest.
+    :param done: futures of send_block that have finished
+    :param in_flight: dict future -> (number of block, records of the block). The finished futures are removed
+    :param sizer: the AdaptiveBlockSizer that is told the result of every block
+    :param breaker: the CircuitBreaker of the external url
+    :return: the number of records deleted
+    """
+    deleted = 0
+    for future in done:
+        block, temps_data = in_flight.pop(future)
+        success, error, latency = future.result()
+        sizer.record(success, latency)
+        breaker.record(success)
+        if not success:
+            mark_failed(temps_data, error)
+        else:
+            # we remove all the data that have been successfully processed
+            deleted_records = delete([td['id'] for td in temps_data])
+            logger.debug(
+                " Request OK for the block {0} .It has been deleted {1} records after this sending".format(
+                    block, deleted_records))
+            deleted += deleted_records
+    return deleted
+
+
+def backoff_delay(attempts):
+    """
+    :param attempts: number of failed attempts of a record
+    :return: seconds to wait before the next attempt (exponential backoff)
+    """
+    base = getattr(settings, 'SEND_DATA_BACKOFF_BASE', 60)
+    return min(base * 2 ** (attempts - 1), getattr(settings, 'SEND_DATA_BACKOFF_MAX', 3600))
+
+
+def mark_failed(temps_data, error):
+    """
+    Record a failed attempt in the given records, scheduling their next attempt. The records that reach
+    SEND_DATA_MAX_ATTEMPTS are not scheduled again.
+    :param temps_data: values of TempData (with id and attempts) of the failed block
+    :param error: description of the error
+    """
+    now = timezone.now()
+    max_attempts = getattr(settings, 'SEND_DATA_MAX_ATTEMPTS', 10)
+    chunk_size = getattr(settings, 'TEMPDATA_DELETE_CHUNK_SIZE', 500)
+    by_attempts = {}
+    for td in temps_data:
+        by_attempts.setdefault(td['attempts'] + 1, []).append(td['id'])
+    for attempts, ids in by_attempts.items():
+        if attempts < max_attempts:
+            next_attempt = now + timezone.timedelta(seconds=backoff_delay(attempts))
+        else:
+            next_attempt = None
+            logger.warning("{0} records of temporal data will not be sent any more after {1} attempts"
+                           .format(len(ids), attempts))
+        for i in range(0, len(ids), chunk_size):
+            TempData.objects.filter(id__in=ids[i:i + chunk_size]).update(
+                attempts=attempts, nextAttempt=next_attempt, lastError=(error or '')[:1000])
+
+
 def convert_data_to_dict(temp_data, config):
     """
-    This method converts temp_data and config in the following structure
+    This method converts temp_data (values of TempData) and config in the following structure
 
     {
   "instrumentContent": [
@@ -262,31 +401,61 @@ def convert_data_to_dict(temp_data, config):
     list_contents = []
     for td in temp_data:
         _dict_td = {
-            "content":td.content,
-            "parameter":td.parameterName,
-            "date":td.queryDate.strftime(settings.DATE_FORMAT_EXTERNAL_WEB_SERVICE),
+            "content":td['content'],
+            "parameter":td['parameterName'],
+            "date":td['queryDate'].strftime(settings.DATE_FORMAT_EXTERNAL_WEB_SERVICE),
             "idApp":config.appId,
             "idCountry":config.countryId,
-            "instrumentName":td.instrumentId
+            "instrumentName":td['instrumentId']
         }
         list_contents.append(_dict_td)
 
-    return {"instrumentContent":list_contents, "instrumentName": temp_data[0].instrumentId}
+    return {"instrumentContent":list_contents, "instrumentName": temp_data[0]['instrumentId']}
+
+
+def convert_data_to_columns(temp_data, config):
+    """
+    Compact variant of convert_data_to_dict. The fields that are the same for all the records of a block are sent only
+    once and the rest are sent as columns:
+
+    {
+  "instrumentName": "IntsPrueba",
+  "idApp": "01",
+  "idCountry": "01",
+  "instrumentContentColumns": {
+    "content": ["sdsjdsj", "aaaa"],
+    "parameter": ["temp", "hum"],
+    "date": ["2015-01-02", "2015-01-01"]
+  }
+}
+    """
+    return {
+        "instrumentName": temp_data[0]['instrumentId'],
+        "idApp": config.appId,
+        "idCountry": config.countryId,
+        "instrumentContentColumns": {
+            "content": [td['content'] for td in temp_data],
+            "parameter": [td['parameterName'] for td in temp_data],
+            "date": [td['queryDate'].strftime(settings.DATE_FORMAT_EXTERNAL_WEB_SERVICE) for td in temp_data],
+        }
+    }
 
 
-def delete(temps_data):
+def delete(temps_data, chunk_size=None):
     """
-    Delete all the data from the database whose ids do not exist in sent_rows
-    :param temps_data: data to be deleted
+    Delete the given records from the database with set-based DELETE ... WHERE id IN (...) statements, each one of
+    chunk_size records as maximum.
+    :param temps_data: data to be deleted, TempData objects or their ids
+    :param chunk_size: maximum number of records per statement (TEMPDATA_DELETE_CHUNK_SIZE by default)
 
     :return: the number of records deleted
     """
-    deleted = 0
-    for tempData in temps_data:
-        tempData.delete()
-        deleted +=1
+    chunk_size = chunk_size or getattr(settings, 'TEMPDATA_DELETE_CHUNK_SIZE', 500)
+    ids = [getattr(tempData, 'id', tempData) for tempData in temps_data]
+    for i in range(0, len(ids), chunk_size):
+        TempData.objects.filter(id__in=ids[i:i + chunk_size]).delete()
 
-    return deleted
+    return len(ids)
 
 
 
@@ -295,18 +464,33 @@ def delete(temps_data):
 ############################
 
 @shared_task
-def clean_data(interval=1440):
+def clean_data(interval=1440, _url=None):
     """
     Clean the Temporal data in TempData table. This task removes all the records that are older than a specify amount of
     minutes computed from now to the past.
+    The records that send_data is still retrying (some failed attempt but less than SEND_DATA_MAX_ATTEMPTS) are kept
+    until they are sent or they run out of attempts. While the circuit of the external url is open send_data does not
+    try to send anything, so the records not tried yet are kept too (the circuit breaker is the one of this worker
+    process, where send_data runs).
     :param interval: minutes interval
+    :param _url: the external url of send_data (SEND_DATA_ENDPOINT_URL by default)
     """
     logger.info("Starting clean_data task")
     deleted = 0
     filter_date_time_condition =timezone.now()-timezone.timedelta(minutes=interval)
-    for temp in TempData.objects.filter(queryDate__lt=timezone.now()-timezone.timedelta(minutes=interval)):
-        deleted+=1
-        temp.delete()
+    chunk_size = getattr(settings, 'TEMPDATA_DELETE_CHUNK_SIZE', 500)
+    old_temps_data = TempData.objects.filter(queryDate__lt=filter_date_time_condition).exclude(
+        attempts__gt=0, attempts__lt=getattr(settings, 'SEND_DATA_MAX_ATTEMPTS', 10))
+    if get_circuit_breaker(_url or getattr(settings, 'SEND_DATA_ENDPOINT_URL', None)).is_open():
+        logger.warning("The circuit of the external url is open, the records not sent yet are kept")
+        old_temps_data = old_temps_data.exclude(attempts=0)
+    # every chunk is deleted in its own statement so the database is not locked for a long time
+    while True:
+        ids = list(old_temps_data.values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            break
+        TempData.objects.filter(id__in=ids).delete()
+        deleted += len(ids)
 
     if deleted:
         logger.info("Has been deleted {0} records of temporal data older than {1}"
@@ -314,3 +498,21 @@ def clean_data(interval=1440):
     else:
         logger.info("No records deleted this time.")
 
+
+@shared_task
+def clean_rollups():
+    """
+    Remove the rollups older than ROLLUP_MINUTE_RETENTION (minute rollups) and ROLLUP_HOUR_RETENTION (hour rollups)
+    days. The rollups are removed by whole days, each one with a single statement on the indexed day.
+    """
+    logger.info("Starting clean_rollups task")
+    today = timezone.now().date()
+    for resolution, retention in (('minute', getattr(settings, 'ROLLUP_MINUTE_RETENTION', 7)),
+                                  ('hour', getattr(settings, 'ROLLUP_HOUR_RETENTION', 365))):
+        rollups = MeasurementRollup.objects.filter(resolution=resolution)
+        days = list(rollups.filter(day__lt=today - timezone.timedelta(days=retention))
+                    .values_list('day', flat=True).distinct())
+        for day in days:
+            rollups.filter(day=day).delete()
+        if days:
+            logger.info("Has been deleted the {0} rollups of {1} days".format(resolution, len(days)))
@@ -0,0 +1,218 @@
+"""
+HTTP client of send_data. All the blocks are sent through a shared requests.Session, so the TCP (and TLS)
+connections to the external server are kept alive and reused between blocks, threads and executions of the task.
+A circuit breaker per external url stops sending blocks to a server that keeps failing.
+"""
+from __future__ import absolute_import
+
+__author__ = 'macastro'
+
+import gzip
+import json
+import logging
+import threading
+import time
+import zlib
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
+
+from django.conf import settings
+
+# Get an instance of a logger
+logger = logging.getLogger(__name__)
+
+_http_session = None
+_block_sizers = {}
+_circuit_breakers = {}
+_lock = threading.Lock()
+
+
+class AdaptiveBlockSizer(object):
+    """
+    AIMD (additive increase, multiplicative decrease) size of the blocks sent by send_data. The size grows by
+    'increase' records after every block accepted in less than target_latency seconds, it is reduced a quarter if the
+    block was slow and halved if it failed. It is always kept between minimum and maximum.
+    """
+    def __init__(self, initial, minimum, maximum, increase, target_latency):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.target_latency = target_latency
+        self.size = self.__bounded(initial)
+
+    def __call__(self):
+        """
+        :return: the size of the next block
+        """
+        return self.size
+
+    def record(self, success, latency):
+        """
+        Adapt the size to the result of a block.
+        :param success: True if the block was accepted by the server
+        :param latency: seconds spent sending the block
+        """
+        if not success:
+            self.size = self.__bounded(self.size // 2)
+        elif latency > self.target_latency:
+            self.size = self.__bounded(self.size * 3 // 4)
+        else:
+            self.size = self.__bounded(self.size + self.increase)
+
+    def __bounded(self, size):
+        return min(max(size, self.minimum), self.maximum)
+
+
+def get_block_sizer(_url, initial):
+    """
+    Return the block sizer of an external url, kept between executions of send_data. If SEND_DATA_ADAPTIVE_BLOCKS is
+    disabled (it is enabled by default) the size is fixed to initial.
+    :param _url: the external url
+    :param initial: initial size (the limit given to send_data)
+    """
+    if not getattr(settings, 'SEND_DATA_ADAPTIVE_BLOCKS', True):
+        return AdaptiveBlockSizer(initial, initial, initial, 0, 0)
+    with _lock:
+        if _url not in _block_sizers:
+            _block_sizers[_url] = AdaptiveBlockSizer(
+                initial,
+                getattr(settings, 'SEND_DATA_BLOCK_MIN', 5),
+                getattr(settings, 'SEND_DATA_BLOCK_MAX', 500),
+                getattr(settings, 'SEND_DATA_BLOCK_INCREASE', 5),
+                getattr(settings, 'SEND_DATA_BLOCK_TARGET_LATENCY', 2.0))
+        return _block_sizers[_url]
+
+
+class CircuitBreaker(object):
+    """
+    Circuit breaker of an external url. After failure_threshold consecutive failed blocks the circuit is opened and
+    nothing is sent to the url for reset_timeout seconds. Then the circuit is half open: blocks are sent again to probe
+    the server, the first success closes the circuit and a failure opens it again for twice the time (up to
+    max_reset_timeout).
+    """
+    def __init__(self, failure_threshold, reset_timeout, max_reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.open_timeout = reset_timeout
+        self.lock = threading.Lock()
+
+    def allow(self, now=None):
+        """
+        :param now: current time in seconds (time.time() by default)
+        :return: True if blocks can be sent to the url (circuit closed or half open)
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            return self.opened_at is None or now - self.opened_at >= self.open_timeout
+
+    def is_open(self):
+        """
+        :return: True if the circuit is open or half open (the url has not answered well since it was opened)
+        """
+        with self.lock:
+            return self.opened_at is not None
+
+    def record(self, success, now=None):
+        """
+        Update the state of the circuit with the result of a block.
+        :param success: True if the block was accepted by the server
+        :param now: current time in seconds (time.time() by default)
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            if success:
+                self.failures = 0
+                self.opened_at = None
+                self.open_timeout = self.reset_timeout
+                return
+            self.failures += 1
+            if self.opened_at is not None:
+                if now - self.opened_at >= self.open_timeout:  # the probe failed
+                    self.open_timeout = min(self.open_timeout * 2, self.max_reset_timeout)
+                    self.opened_at = now
+                    logger.warning("The circuit is open again for {0} s".format(self.open_timeout))
+            elif self.failures >= self.failure_threshold:
+                self.opened_at = now
+                logger.warning("{0} consecutive failures, the circuit is open for {1} s"
+                               .format(self.failures, self.open_timeout))
+
+
+def get_circuit_breaker(_url):
+    """
+    Return the circuit breaker of an external url, kept between executions of send_data.
+    :param _url: the external url
+    """
+    with _lock:
+        if _url not in _circuit_breakers:
+            _circuit_breakers[_url] = CircuitBreaker(
+                getattr(settings, 'SEND_DATA_CIRCUIT_FAILURES', 3),
+                getattr(settings, 'SEND_DATA_CIRCUIT_RESET', 60),
+                getattr(settings, 'SEND_DATA_CIRCUIT_RESET_MAX', 3600))
+        return _circuit_breakers[_url]
+
+
+def get_http_session():
+    """
+    Return the requests.Session of this process, creating it the first time. Its connection pool is big enough for
+    SEND_DATA_MAX_IN_FLIGHT concurrent blocks.
+    """
+    global _http_session
+    with _lock:
+        if _http_session is None:
+            pool_size = max(getattr(settings, 'SEND_DATA_MAX_IN_FLIGHT', 1), 1)
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, pool_block=True)
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _http_session = session
+        return _http_session
+
+
+def encode_payload(data_to_be_sent, content_encoding=None):
+    """
+    Serialize a block to json and compress it if it is configured.
+    :param data_to_be_sent: dict built by convert_data_to_dict or convert_data_to_columns
+    :param content_encoding: None (plain json), 'gzip' or 'deflate'
+    :return: a tuple (body, headers) for the request
+    """
+    final_data = json.dumps(data_to_be_sent, separators=(',', ':')).encode('utf-8')
+    headers = {'Content-Type': 'application/json'}
+    if content_encoding == 'gzip':
+        final_data = gzip.compress(final_data)
+    elif content_encoding == 'deflate':
+        final_data = zlib.compress(final_data)
+    elif content_encoding:
+        raise ValueError('Content encoding not supported: {0}'.format(content_encoding))
+    if content_encoding:
+        headers['Content-Encoding'] = content_encoding
+    return final_data, headers
+
+
+def post_block(_url, USER, PASS, data_to_be_sent, block):
+    """
+    Send a block of data to the external url. The body is compressed with SEND_DATA_CONTENT_ENCODING.
+    :param data_to_be_sent: dict built by convert_data_to_dict or convert_data_to_columns
+    :param block: number of the block (for logging)
+    :return: a tuple (True if the external server has created the records, description of the error or None)
+    """
+    try:
+        logger.debug(">>  final_data {0}".format(data_to_be_sent))
+        final_data, headers = encode_payload(data_to_be_sent, getattr(settings, 'SEND_DATA_CONTENT_ENCODING', None))
+        response = get_http_session().post(_url,final_data,auth=HTTPBasicAuth(USER,PASS), headers=headers,
+                                           timeout=getattr(settings, 'SEND_DATA_TIMEOUT', 60))
+
+        logger.debug(">>  response {0}".format(response))
+        logger.debug(">>  content {0}".format(response.content))
+    except Exception as exc:
+        logger.error("Error during connection with external URL for block {0} of data".format(block))
+        logger.error(exc)
+        return False, '{0}: {1}'.format(type(exc).__name__, exc)
+
+    if response.status_code != requests.codes.created:
+        return False, 'HTTP {0}: {1}'.format(response.status_code, response.text[:200])
+    return True, None
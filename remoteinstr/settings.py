@@ -194,19 +194,90 @@ DEACTIVATE_CHECK_BACKENDS = False
 SEND_DATA_ENDPOINT_URL = 'http://lifewatch.viavansi.com/lifewatch-service-rest/instrumentContent/createlist'
 SEND_DATA_ENDPOINT_USER = 'lifewatch_user'
 SEND_DATA_ENDPOINT_PASSWORD = 'lifewatch_pass'
+SEND_DATA_MAX_IN_FLIGHT = 4  # blocks sent at the same time (keep-alive connections to the external server)
+SEND_DATA_TIMEOUT = 60  # seconds waiting for the external server
+SEND_DATA_CONTENT_ENCODING = None  # compression of the blocks: None, 'gzip' or 'deflate' (the server must support it)
+SEND_DATA_PAYLOAD_FORMAT = 'records'  # 'records' (a dict per record) or 'columnar' (the server must support it)
+SEND_DATA_ADAPTIVE_BLOCKS = True  # adapt the size of the blocks (AIMD) to the latency and errors of the server
+SEND_DATA_BLOCK_MIN = 5  # minimum records per block
+SEND_DATA_BLOCK_MAX = 500  # maximum records per block
+SEND_DATA_BLOCK_INCREASE = 5  # records added to the size after every fast block
+SEND_DATA_BLOCK_TARGET_LATENCY = 2.0  # seconds, a slower block reduces the size
+SEND_DATA_MAX_ATTEMPTS = 10  # failed attempts before a record is not sent any more (clean_data removes it)
+SEND_DATA_BACKOFF_BASE = 60  # seconds before retrying a failed record, doubled after every failed attempt
+SEND_DATA_BACKOFF_MAX = 3600  # maximum seconds between attempts of a record
+SEND_DATA_CIRCUIT_FAILURES = 3  # consecutive failed blocks that open the circuit of the external url
+SEND_DATA_CIRCUIT_RESET = 60  # seconds the circuit stays open before probing the server again
+SEND_DATA_CIRCUIT_RESET_MAX = 3600  # maximum seconds open, the time is doubled after every failed probe
+
+# Pool of open PyVisa sessions (one per instrument) shared by the views and the tasks of a process
+VISA_SESSION_POOL_MAX_SIZE = 16  # maximum number of instruments kept open
+VISA_SESSION_POOL_IDLE_TIMEOUT = 300  # seconds without use before closing a session
+VISA_SESSION_POOL_ACQUIRE_TIMEOUT = 60  # seconds waiting for an instrument used by another client
+
+# Maximum number of instruments collected at the same time by collect_data (one thread per physical instrument)
+COLLECT_DATA_MAX_WORKERS = 8
+COLLECT_DATA_SHUTDOWN_WAIT = 30  # seconds waiting for the lanes running when the worker stops
+
+# Writing of the measurements collected (TempData). They are buffered and written together in one transaction
+TEMPDATA_FLUSH_EACH_CYCLE = True  # write at every tick of collect_data (the lanes finished since the previous one)
+TEMPDATA_FLUSH_MAX_RECORDS = 500  # write when the buffer has this number of records
+TEMPDATA_FLUSH_MAX_DELAY = 5000  # write when the oldest record buffered has waited these milliseconds
+
+# Maximum number of TempData records deleted by statement (send_data and clean_data)
+TEMPDATA_DELETE_CHUNK_SIZE = 500
+
+# Bytes read from the instrument by chunk in the streaming raw reads (read_raw/stream, query_raw/stream)
+RAW_STREAM_CHUNK_SIZE = 65536
+
+# Maximum number of commands of a batch (/v1/instruments/<id>/commands/batch/)
+BATCH_MAX_COMMANDS = 50
+
+# Same command on several instruments concurrently (/v1/commands/fanout/)
+FANOUT_MAX_INSTRUMENTS = 100  # one lane (thread) per instrument, in a pool of its own for every request
+FANOUT_MAX_LANES = 200  # lanes running at the same time in a process (abandoned ones included), 503 beyond it
+FANOUT_DEADLINE = 10  # seconds waited by default for all the instruments
+FANOUT_MAX_DEADLINE = 60
+
+# Asynchronous direct commands (?async=true, /v1/jobs/<jobId>/)
+COMMAND_JOBS_BACKEND = 'celery'  # 'celery' (executed by the workers) or 'thread' (a thread pool of the web server)
+# Celery queue of the jobs (None for the default one). They have a queue of their own so they do not wait behind
+# collect_data, which runs every COLLECT_DATA_TICK on workers with CELERYD_CONCURRENCY = 1. A worker must consume it:
+#   celery -A remoteinstr worker -Q commands
+COMMAND_JOBS_QUEUE = 'commands'
+COMMAND_JOBS_MAX_WORKERS = 4  # threads of the pool ('thread' backend)
+COMMAND_JOBS_MAX_WAIT = 30  # maximum seconds of the long polling
+COMMAND_JOBS_POLL_INTERVAL = 0.2  # seconds between reads of the job during the long polling
+COMMAND_JOBS_RETENTION = 24  # hours that the jobs are kept (clean_jobs)
+COMMAND_JOBS_STALE_TIMEOUT = 600  # seconds after which a job not finished is marked as failed (clean_jobs)
+
+# Read API of the measurements (/v1/instruments/<id>/measurements/)
+MEASUREMENTS_PAGE_SIZE = 1000  # measurements per page by default
+MEASUREMENTS_MAX_PAGE_SIZE = 10000
+MEASUREMENTS_MAX_POINTS = 5000  # maximum number of points of a downsampled series
+MEASUREMENTS_MAX_LTTB_INPUT = 50000  # longer series are reduced to bucket means before LTTB (memory bound)
+EXPORT_BLOCK_SIZE = 2000  # measurements read by query in the exports
+
+# Days that the rollups of the numeric measurements are kept (clean_rollups)
+ROLLUP_MINUTE_RETENTION = 7
+ROLLUP_HOUR_RETENTION = 365
 
 # The number of threads (tasks)  opened per worker.
 CELERYD_CONCURRENCY = 1
 
+# Period (seconds) of collect_data. Every instrument is polled at its own taskInterval, so this is the resolution
+# of the intervals
+COLLECT_DATA_TICK = 1
+
 # Task schedule
 CELERYBEAT_SCHEDULE = {
 
     # Recogida de datos de los instrumentos, los resultados se almacenan en una tabla temporal
     'collect-data': {
         'task': 'daemonsceleryapp.tasks.collect_data',
-        'schedule': timedelta(seconds=10),  # CONFIGURABLE --> periodo en segundos de ejecucin de la tarea
+        'schedule': timedelta(seconds=COLLECT_DATA_TICK),  # CONFIGURABLE --> periodo en segundos de ejecucin de la tarea
         'options': {
-            'expires': 20
+            'expires': 2 * COLLECT_DATA_TICK
         },
     },
 
@@ -230,6 +301,27 @@ CELERYBEAT_SCHEDULE = {
 
     },
 
+    # Limpieza de los agregados por minuto y hora (por dias completos).
+    'clean-rollups': {
+        'task': 'daemonsceleryapp.tasks.clean_rollups',
+        'schedule': timedelta(hours=6),
+    },
+
+    # Limpieza de los trabajos de los comandos asincronos.
+    'clean-jobs': {
+        'task': 'remoteinstrapp.tasks.clean_jobs',
+        'schedule': timedelta(minutes=10),
+    },
+
+}
+
+# Cache shared by the web service and the celery workers (used to invalidate the compiled plan of collect_data).
+# It must be a cache shared between processes (file based, memcached, database...)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+    }
 }
 
 # Base de datos
@@ -18,6 +18,8 @@ from django.contrib import admin
 
 from remoteinstrapp.views import generic_views
 from remoteinstrapp.views import direct_command_views
+from remoteinstrapp.views import measurement_views
+from remoteinstrapp.views import job_views
 
 
 urlpatterns = [
@@ -42,6 +44,21 @@ urlpatterns = [
         direct_command_views.CommandReadRawViewSet.as_view({'post': 'perform_query',})),
     url(r'^v1/instruments/(?P<instrumentId>[^/]+)/commands/get_visa_attribute/$',
         direct_command_views.CommandGetVisaAttrViewSet.as_view({'post': 'perform_query',})),
+    url(r'^v1/instruments/(?P<instrumentId>[^/]+)/commands/read_raw/stream/$',
+        direct_command_views.CommandReadRawStreamViewSet.as_view({'post': 'perform_read_raw_stream',})),
+    url(r'^v1/instruments/(?P<instrumentId>[^/]+)/commands/query_raw/stream/$',
+        direct_command_views.CommandQueryRawStreamViewSet.as_view({'post': 'perform_query_raw_stream',})),
+    url(r'^v1/instruments/(?P<instrumentId>[^/]+)/commands/batch/$',
+        direct_command_views.CommandBatchViewSet.as_view({'post': 'perform_batch',})),
+    url(r'^v1/instruments/(?P<instrumentId>[^/]+)/commands/query_binary_values/$',
+        direct_command_views.CommandQueryBinaryValuesViewSet.as_view({'post': 'perform_query_binary_values',})),
+
+    url(r'^v1/commands/fanout/$', direct_command_views.CommandFanoutViewSet.as_view({'post': 'perform_fanout',})),
+    url(r'^v1/jobs/(?P<jobId>[^/]+)/$', job_views.JobView.as_view(), name='job-detail'),
+
+    url(r'^v1/measurements/export/$', measurement_views.MeasurementsExportView.as_view(), name='measurements-export'),
+    url(r'^v1/instruments/(?P<instrumentId>[^/]+)/measurements/$',
+        measurement_views.MeasurementsView.as_view(), name='measurements-list'),
 
     url(r'^v1/instruments/(?P<instrumentId>[^/]+)/capabilities/$',
         generic_views.CapabilitiesList.as_view(), name='capabilities-list'),
@@ -0,0 +1,79 @@
+"""
+Registry of PyVisa ResourceManagers. Creating a ResourceManager loads the VISA library (or the modules of the '@py'
+backend), so only one is created per backend string and process and it is shared by the discovery of instruments and
+by the sessions that execute commands.
+"""
+__author__ = 'macastro'
+
+import atexit
+import logging
+import threading
+import time
+
+from remoteinstrapp import exceptions
+
+# Check of installation of PyVisa
+try:
+    import visa
+except ImportError:
+    errmsg = 'ERROR: PyVisa is not installed '
+    raise ImportError(errmsg)
+
+# Get an instance of a logger
+logger = logging.getLogger(__name__)
+
+_resource_managers = {}
+_load_stats = {}
+_lock = threading.Lock()
+
+
+def get_resource_manager(backend):
+    """
+    Return the ResourceManager of a backend, loading it the first time.
+    :param backend: the pyvisa backend used
+    :return: the visa.ResourceManager shared in this process
+    """
+    with _lock:
+        resource_manager = _resource_managers.get(backend)
+        if resource_manager is not None:
+            _load_stats[backend]['reused'] += 1
+            return resource_manager
+
+        logger.debug('Trying to load "{0}" backend...'.format(backend))
+        start = time.time()
+        try:
+            resource_manager = visa.ResourceManager(backend)
+        except OSError as error:
+            raise exceptions.NoBackendError(error)
+        load_time = time.time() - start
+        logger.info('Backend "{0}" loaded in {1:.3f} seconds'.format(backend, load_time))
+
+        _resource_managers[backend] = resource_manager
+        _load_stats[backend] = {'loadTime': load_time, 'loadedAt': time.time(), 'reused': 0}
+        return resource_manager
+
+
+def get_load_stats():
+    """
+    Timing of the backends loaded in this process.
+    :return: a list of dicts with the backendId, the seconds spent loading it (loadTime), the timestamp when it was
+    loaded (loadedAt) and how many times it has been reused since then (reused)
+    """
+    with _lock:
+        return [dict(backendId=backend, **stats) for backend, stats in sorted(_load_stats.items())]
+
+
+def close_all():
+    """
+    Close all the ResourceManagers (used at shutdown)
+    """
+    with _lock:
+        for backend, resource_manager in list(_resource_managers.items()):
+            try:
+                resource_manager.close()
+            except Exception as exc:
+                logger.warning('Error closing "{0}" backend: {1}'.format(backend, exc))
+        _resource_managers.clear()
+
+
+atexit.register(close_all)
@@ -0,0 +1,132 @@
+"""
+This module executes the tasks configured in database (Task -> Commands) against the instruments. All the commands of
+the tasks of an instrument run on the same open session, loading the instrument and its PyVisa parameters only once.
+"""
+__author__ = 'macastro'
+
+import logging
+
+from collections import namedtuple
+
+from remoteinstrapp.serializers import CommandSerializer
+from remoteinstrapp.app_management import manager
+from remoteinstrapp.utils import convert_tools as ct
+
+# Get an instance of a logger
+logger = logging.getLogger(__name__)
+
+# Map for choose the correct manager
+callable_manager_map = {
+        'query_raw': manager.QueryRawInstrumentManager,
+        'query': manager.QueryInstrumentManager,
+        'write_raw': manager.WriteRawCommandManager,
+        'read_raw': manager.ReadRawCommandManager,
+        'read':manager.ReadCommandManager,
+        'write':manager.WriteCommandManager,
+        'get_visa_attribute':manager.GetVisaAttributeCommandManager,
+        'query_binary_values':manager.QueryBinaryValuesManager
+
+    }
+
+
+# A command ready to be executed: the data for execute_command (hex messages of raw methods already decoded) and
+# its Visa attributes already resolved
+CompiledCommand = namedtuple('CompiledCommand', ['commandId', 'method', 'data', 'visaAttributes'])
+
+
+def compile_command(command):
+    """
+    Do all the work of a command that does not depend on the instrument. It is done once and the compiled command
+    can be executed many times.
+    :param command: Command object (models), better with its visa attributes prefetched
+    :return: a CompiledCommand
+    """
+    data = dict(CommandSerializer(command).data)
+    if command.method in ('write_raw', 'query_raw') and data.get('message'):
+        try:
+            data['message'] = ct.to_byte(data['message'])
+        except ValueError:
+            pass  # not hexadecimal, the manager will report the error when it is executed
+    visaAttributes = manager.resolve_attributes(command.visaAttributes_numeric.all(),
+                                                command.visaAttributes_string.all())
+    return CompiledCommand(command.commandId, command.method, data, visaAttributes)
+
+
+class TaskExecutor(object):
+    """
+    Opens an instrument once (session from the pool + pyvisaParameters) and runs the command sequence of its tasks
+    on it. Every command is executed by its specific manager sharing the session, so the delay, lock and
+    visaAttributes of each command are honoured as when they are executed one by one.
+    """
+    def __init__(self, instrumentId, instrument=None, parameters=None):
+        '''
+        Constructor of the class, it opens the instrument.
+        :param instrumentId: the instrumentId used to recover the instrument
+        :param instrument: the Instrument already loaded, if any (see RemoteInstAppManager)
+        :param parameters: the pyvisa parameters already resolved, if any (see RemoteInstAppManager)
+        '''
+        self.instrumentId = instrumentId
+        self.failed = False
+        self.manager = manager.RemoteInstAppManager(instrumentId, instrument=instrument, parameters=parameters)
+
+    def run(self, task, commands=None):
+        """
+        Execute all the commands of a task in seqNumber order. If any command fails the sequence is started again
+        from scratch, on the same session, up to task.retries times.
+        :param task: Task object (models) or any object with taskId and retries
+        :param commands: the commands of the task (Command or CompiledCommand) in seqNumber order. They are loaded
+        from database if they are not given
+        :return: the Response of the last command if the sequence went well, None otherwise
+        """
+        if commands is None:
+            commands = list(task.commands.all().order_by('seqNumber'))
+        if not commands:
+            logger.warning("There is not any command for this task, please review your configuration")
+            return None
+
+        retries = -1 # counter of retries, if we talk of tries should be 0
+        while retries < task.retries:
+            response = self.__run_sequence(task, commands, retries + 2)
+            if response is not None:
+                return response
+            retries += 1 # add a new attempt
+        return None
+
+    def __run_sequence(self, task, commands, attempt):
+        response = None
+        self.failed = False
+        for command in commands:
+            try:
+                logger.debug("- Executing command {0}:{1}".format(command.commandId,command.method))
+                if not isinstance(command, CompiledCommand):
+                    command = compile_command(command)
+                mng = callable_manager_map[command.method](self.instrumentId, shared=self.manager)
+                mng.setVisaAttributes(command.visaAttributes)
+                response = mng.execute_command(dict(command.data))
+                logger.debug(response.response_data)
+                if response.response_data['state'] != 'success':
+                    raise Exception("ERROR: misunderstanding in the commands sent")
+            except Exception as excep:
+                logger.error(" Error during execution over:instrument {0} --> task{1} -->in command {2}, attempt {3}"
+                             .format(self.instrumentId, task.taskId, command.method, attempt))
+                logger.error(str(excep))
+                self.failed = True
+                return None
+            finally:
+                self.__restore_attributes()
+
+        return response
+
+    def __restore_attributes(self):
+        # the visaAttributes of a command must not be inherited by the next one
+        try:
+            self.manager.session.restore_attributes()
+        except Exception as excep:
+            logger.warning("The visa attributes could not be restored: {0}".format(excep))
+            self.failed = True
+
+    def close(self):
+        """
+        Give back the session to the pool, closing it if the last sequence failed.
+        """
+        self.manager.close(discard=self.failed)
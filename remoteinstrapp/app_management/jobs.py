@@ -0,0 +1,159 @@
+"""
+Asynchronous execution of the direct commands. The view stores a Job and returns 202 immediately, the command is
+executed by a celery worker (COMMAND_JOBS_BACKEND = 'celery') or by a thread pool of the web server process
+('thread') and the client polls, or long-polls, /v1/jobs/<jobId>/. So a slow instrument does not hold a worker of the
+web server for the whole round trip.
+"""
+__author__ = 'macastro'
+
+import base64
+import json
+import logging
+import threading
+import time
+import uuid
+
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from remoteinstrapp.models import Job
+from remoteinstrapp.app_management.runner import run_command
+
+# Get an instance of a logger
+logger = logging.getLogger(__name__)
+
+_executor = None
+_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Return the thread pool of this process for the jobs (COMMAND_JOBS_MAX_WORKERS threads), creating it the first time.
+    """
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'COMMAND_JOBS_MAX_WORKERS', 4))
+        return _executor
+
+
+def submit_job(instrumentId, manager_type, data):
+    """
+    Store a job and send it to be executed.
+    :param instrumentId: the instrumentId of the instrument
+    :param manager_type: key of runner.manager_types
+    :param data: dict with the parameters of the command
+    :return: the Job
+    """
+    job = Job.objects.create(jobId=uuid.uuid4().hex, instrumentId=instrumentId, managerType=manager_type,
+                             data=json.dumps(data))
+    if getattr(settings, 'COMMAND_JOBS_BACKEND', 'celery') == 'thread':
+        get_executor().submit(run_job_thread, job.jobId)
+    else:
+        from remoteinstrapp.tasks import execute_job
+        execute_job.apply_async((job.jobId,), queue=getattr(settings, 'COMMAND_JOBS_QUEUE', None))
+    logger.debug("Job {0} submitted: {1} to {2}".format(job.jobId, manager_type, instrumentId))
+    return job
+
+
+def run_job(jobId):
+    """
+    Execute the command of a pending job and store its result. A job is only executed once, although it is received
+    several times.
+    :param jobId: the jobId of the Job
+    :return: True if the job has been executed
+    """
+    if not Job.objects.filter(jobId=jobId, state='pending').update(state='running', started=timezone.now()):
+        logger.warning("Job {0} does not exist or it has already been executed".format(jobId))
+        return False
+    job = Job.objects.get(jobId=jobId)
+    try:
+        rest_response, http_state, binary = run_command(job.instrumentId, job.managerType, json.loads(job.data))
+        if binary is not None: # there is no octet stream in the json of the job
+            rest_response['result'] = base64.b64encode(binary.tobytes()).decode('ascii')
+    except Exception as error:
+        logger.error("Job {0} failed: {1}".format(jobId, error))
+        rest_response, http_state = {'state': 'unknownError', 'result': str(error)}, 500
+    Job.objects.filter(jobId=jobId).update(state='done', httpStatus=http_state, result=json.dumps(rest_response),
+                                           finished=timezone.now())
+    return True
+
+
+def run_job_thread(jobId):
+    """
+    run_job in a thread of the pool, the database connection of the thread is closed at the end.
+    """
+    try:
+        return run_job(jobId)
+    finally:
+        connection.close()
+
+
+def wait_job(jobId, timeout, interval=None):
+    """
+    Wait until a job is done or timeout seconds have elapsed (long polling).
+    :param jobId: the jobId of the Job
+    :param timeout: maximum seconds to wait, 0 to return the job as it is
+    :param interval: seconds between reads of the job (COMMAND_JOBS_POLL_INTERVAL by default)
+    :return: the Job. Job.DoesNotExist if it does not exist
+    """
+    interval = interval or getattr(settings, 'COMMAND_JOBS_POLL_INTERVAL', 0.2)
+    deadline = time.time() + timeout
+    job = Job.objects.get(jobId=jobId)
+    while job.state != 'done' and time.time() < deadline:
+        time.sleep(min(interval, max(deadline - time.time(), 0)))
+        job = Job.objects.get(jobId=jobId)
+    return job
+
+
+def job_to_dict(job, location=None):
+    """
+    :param job: a Job
+    :param location: url of the job (optional)
+    :return: dict with the state of the job and, once it is done, the response of the command
+    """
+    job_dict = {
+        'jobId': job.jobId,
+        'instrumentId': job.instrumentId,
+        'state': job.state,
+        'created': job.created,
+        'started': job.started,
+        'finished': job.finished,
+    }
+    if location:
+        job_dict['location'] = location
+    if job.state == 'done':
+        job_dict['httpStatus'] = job.httpStatus
+        job_dict['response'] = json.loads(job.result)
+    return job_dict
+
+
+def fail_stale_jobs(seconds):
+    """
+    Mark as failed the jobs that have been running, or waiting for a worker, for more than seconds: their worker or
+    process died (or no worker consumes COMMAND_JOBS_QUEUE) and they would never be done, so the clients polling them
+    would wait forever. If the command finishes after all, its result replaces the error.
+    :return: number of jobs marked as failed
+    """
+    limit = timezone.now() - timezone.timedelta(seconds=seconds)
+    rest_response = {'state': 'unknownError', 'result': 'The job has not finished in {0} seconds'.format(seconds)}
+    stale = Job.objects.filter(Q(state='running', started__lt=limit) | Q(state='pending', created__lt=limit))
+    count = stale.update(state='done', httpStatus=500, result=json.dumps(rest_response), finished=timezone.now())
+    if count:
+        logger.warning("{0} stale jobs have been marked as failed".format(count))
+    return count
+
+
+def clean_jobs(hours):
+    """
+    Remove the jobs created more than hours ago.
+    :return: number of jobs removed
+    """
+    jobs = Job.objects.filter(created__lt=timezone.now() - timezone.timedelta(hours=hours))
+    count = jobs.count()
+    jobs.delete()
+    return count
@@ -1,12 +1,16 @@
 __author__ = 'macastro'
 
+import base64
 import logging
+import time
 
+from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
 from rest_framework import status
 from remoteinstrapp.models import Instrument
 from remoteinstrapp.utils import convert_tools as ct
-from remoteinstrapp import exceptions
+from remoteinstrapp.app_management import backends
+from remoteinstrapp.app_management.session_pool import session_pool
 
 # Check of installation of PyVisa
 try:
@@ -25,16 +29,33 @@ logger = logging.getLogger(__name__)
 
 def get_resources(backend):
     """
-    Load its backend and returns a list of all the devices connected to the computer.
+    Load its backend (only the first time) and returns a list of all the devices connected to the computer.
     :param backend: the pyvisa backend used
     :return: the list of instruments connected to the computer
     """
-    rm = visa.ResourceManager(backend)
-    results = rm.list_resources('?*')
-    rm.close()
+    results = backends.get_resource_manager(backend).list_resources('?*')
     return list(results)
 
 
+def resolve_attributes(numeric_params, string_params):
+    """
+    Compute the values of PyVisa parameters or Visa attributes (numeric and string models) as they have to be set in
+    the resource: integer numeric states are cast to int and the constant string states are replaced by its value
+    in pyvisa.constants.
+    :param numeric_params: iterable of objects with name and state (float)
+    :param string_params: iterable of objects with name, state and isConstant
+    :return: a tuple of (name, value) pairs, the numeric ones first
+    """
+    resolved = []
+    for numeric_param in numeric_params:
+        state = numeric_param.state
+        resolved.append((numeric_param.name, int(state) if state == int(state) else state))
+    for string_param in string_params:
+        val = getattr(v_cons, string_param.state) if string_param.isConstant else string_param.state
+        resolved.append((string_param.name, val))
+    return tuple(resolved)
+
+
 class Response(object):
     """
     Wrapper of the PyVisa response to the views
@@ -43,6 +64,8 @@ class Response(object):
         self.status = None
         self.response_data = {}
         self.error = ''
+        self.binary = None  # raw data returned as application/octet-stream instead of json (if any)
+        self.stream = None  # generator of chunks sent to the client while they are read (if any)
 
 
 ############################################
@@ -56,19 +79,39 @@ class RemoteInstAppManager(object):
     execute_command method.
     """
     #TODO: Include more refactor in this class removing code from 'execute_command' methods
-    def __init__(self, instrumentId):
+    def __init__(self, instrumentId, shared=None, instrument=None, parameters=None):
         '''
         Constructor of the class, used to load the necessary common steps.
         :param instrumentId: the instrumentId used to recover the instrument
+        :param shared: another manager of the same instrument whose open session is reused, skipping all the common
+        steps (used by TaskExecutor). The session is given back to the pool by that manager, not by this one.
+        :param instrument: the Instrument already loaded (with its parameters prefetched), so it is not loaded again
+        from database
+        :param parameters: the pyvisa parameters of the instrument already resolved (see resolve_attributes)
         '''
         self.instrument = None
         self.response = Response()
         self.resource_name = None
         self.resource = None
-        self.__load_instrument(instrumentId)
-        self.__load_visa_backend()
-        self.__open_resource()
-        self.__load_parameters()
+        self.session = None
+        self.shared = shared is not None
+        if self.shared:
+            self.instrument = shared.instrument
+            self.resource_name = shared.resource_name
+            self.resource = shared.resource
+            self.session = shared.session
+            return
+
+        if instrument is None:
+            self.__load_instrument(instrumentId)
+        else:
+            self.instrument = instrument
+        self.__acquire_session()
+        try:
+            self.__load_parameters(parameters)
+        except Exception:
+            self.close(discard=True)
+            raise
 
         # timeout by default (for security reasons such as avoid blocking)
         self.resource.timeout = 30000  # 30 segundos
@@ -86,51 +129,29 @@ class RemoteInstAppManager(object):
         self.instrument = instruments[0]
         logger.debug('OK')
 
-    def __load_visa_backend(self):
+    def __acquire_session(self):
         """
-        Attempt to opening the Pyvisa backend
+        Attempt to get an open Pyvisa resource from the session pool (opening the backend and the resource if the
+        instrument has not been used yet). Raises NoBackendError or OpenInstrumentError like the PyVisa calls.
         """
-        logger.debug('Trying to open "{0}" backend...'.format(self.instrument.backend))
-        try:
-            self.resource_name = visa.ResourceManager(self.instrument.backend)
-            logger.debug('OK')
-        except OSError as error:
-            raise exceptions.NoBackendError(error)
-        except ValueError as error:
-            raise error
-        except Exception as error:
-            raise error
-
-    def __open_resource(self):
-        """
-        Attempt to opening the Pyvisa resource
-        """
-        try:
-            logger.debug('Trying to open resource "{0}" ...'.format(self.instrument.visaId))
-            self.resource = self.resource_name.open_resource(self.instrument.visaId)
-            logger.debug('OK')
-        except OSError as error:
-            raise exceptions.OpenInstrumentError(error)
-        except Exception as error:
-            raise error
+        self.session = session_pool.acquire(self.instrument.backend, self.instrument.visaId)
+        self.resource_name = self.session.resource_manager
+        self.resource = self.session.resource
 
-    def __load_parameters(self):
+    def __load_parameters(self, parameters=None):
         """
         Load the parameters from database. PyVisa_string_Parameters and PyVisa_numeric_ Parameters
+        :param parameters: the parameters already resolved (see resolve_attributes). If they are not given they are
+        recovered from the instrument
         """
         logger.debug('Trying to load the parameters ...')
-        for numeric_param in self.instrument.pyvisaParameters_numeric.all():
-            if numeric_param.state == int (numeric_param.state):
-                setattr(self.resource, numeric_param.name,int(numeric_param.state))
-            else:
-                setattr(self.resource, numeric_param.name,numeric_param.state)
-            if getattr(self.resource, numeric_param.name) != numeric_param.state:
-                raise AttributeError ('A numeric parameter has not been able to be set')
-        for string_param in self.instrument.pyvisaParameters_string.all():
-            val = getattr(v_cons, string_param.state) if string_param.isConstant else string_param.state
-            setattr(self.resource, string_param.name, val)
-            if getattr(self.resource, string_param.name) != val:
-                raise AttributeError('A string parameter has not been able to be set')
+        if parameters is None:
+            parameters = resolve_attributes(self.instrument.pyvisaParameters_numeric.all(),
+                                            self.instrument.pyvisaParameters_string.all())
+        for name, val in parameters:
+            setattr(self.resource, name, val)
+            if getattr(self.resource, name) != val:
+                raise AttributeError('The parameter {0} has not been able to be set'.format(name))
         logger.debug('OK')
 
 
@@ -142,20 +163,19 @@ class RemoteInstAppManager(object):
         necessary to perform the method.
         """
         logger.debug('Trying to load the attributes from database ...')
-        for numeric_param in command.visaAttributes_numeric.all():
-            if numeric_param.state == int (numeric_param.state):
-                setattr(self.resource, numeric_param.name,int(numeric_param.state))
-            else:
-                setattr(self.resource, numeric_param.name,numeric_param.state)
-            if getattr(self.resource, numeric_param.name) != numeric_param.state:
-                raise AttributeError ('A numeric Visa attribute has not been able to be set')
-
-        for string_param in command.visaAttributes_string.all():
-            val = getattr(v_cons, string_param.state) if string_param.isConstant else string_param.state
-            setattr(self.resource, string_param.name, val)
-            if getattr(self.resource, string_param.name) != val:
-                raise AttributeError('A string Visa attribute  has not been able to be set')
+        self.setVisaAttributes(resolve_attributes(command.visaAttributes_numeric.all(),
+                                                  command.visaAttributes_string.all()))
 
+
+    def setVisaAttributes(self, attributes):
+        """
+        Set the PyVisa attributes of a command, they are restored when the session goes back to the pool.
+        :param attributes: (name, value) pairs already resolved (see resolve_attributes)
+        """
+        for name, val in attributes:
+            self.session.set_attribute(name, val)
+            if getattr(self.resource, name) != val:
+                raise AttributeError('The Visa attribute {0} has not been able to be set'.format(name))
         logger.debug('OK')
 
 
@@ -168,7 +188,7 @@ class RemoteInstAppManager(object):
             visaAttributes = data.pop('visaAttributes',{})
             for x in visaAttributes:
                 val = getattr(v_cons, x['state']) if x['isConstant'] and x['state'] in dir(v_cons) else x['state']
-                setattr(self.resource, x['name'], val)
+                self.session.set_attribute(x['name'], val)
                 if getattr(self.resource, x['name']) != val:
                     raise AttributeError('A visa attribute has not been able to be set')
         except TypeError as error:
@@ -176,15 +196,19 @@ class RemoteInstAppManager(object):
         except Exception as error:
             raise error
 
-    def close(self):
+    def close(self, discard=None):
         """
-        Attempt to close the resource and the resourcename, All at once.
+        Give the resource back to the session pool. The session is closed instead of pooled if the last command
+        did not finish successfully, since the instrument could be in a wrong state. It can be called several times.
+        :param discard: force (True) or avoid (False) closing the session. By default it depends on the response state
         """
-        try:
-            self.resource.close()
-            self.resource_name.close()
-        except Exception as exc:
-            raise exc
+        if self.session is None or self.shared:
+            return
+        if discard is None:
+            discard = self.response.response_data.get('state', 'success') != 'success'
+        session = self.session
+        self.session = None
+        session_pool.release(session, discard=discard)
 
     def execute_command(self, data):
         """
@@ -233,7 +257,7 @@ class WriteRawCommandManager(RemoteInstAppManager):
 
         # Do the query
         try:
-            message = ct.to_byte(message)
+            message = ct.to_byte(message)  # it could be already decoded (compiled commands)
             response = self.resource.write_raw(message)
             logger.info(response)
         except:
@@ -366,7 +390,7 @@ class QueryRawInstrumentManager(RemoteInstAppManager):
 
         try:
             import time
-            message = ct.to_byte(message)
+            message = ct.to_byte(message)  # it could be already decoded (compiled commands)
             logger.debug(message)
             response1 = self.resource.write_raw(message)
             logger.debug(message)
@@ -640,3 +664,207 @@ class GetVisaAttributeCommandManager(RemoteInstAppManager):
 
         self.close()
         return self.response
+
+
+class QueryBinaryValuesManager(RemoteInstAppManager):
+    """
+    Query_binary_values command implementation. Used for instruments that return IEEE 488.2 binary blocks
+    (oscilloscopes, spectrum analyzers...). The block is read into a single buffer and its data is interpreted as a
+    NumPy array (dtype, big_endian) without copying it. The values are returned in base64 ('output': 'base64') or as
+    a raw octet stream ('output': 'octet').
+    """
+    def execute_command(self, data):
+        logger.info("executing query_binary_values to {0}".format(self.instrument.instrumentId))
+        self.setting_visa_attributes(data) # could raise an AttributeError
+        message = data.get('message') or ""
+        size = data.get('size')
+        delay = data.get('delay', 0)
+        lock = data.get('lock', "")
+        dtype = data.get('dtype', 'f4')
+        big_endian = data.get('big_endian', False)
+        output = data.get('output', 'base64')
+
+        try:
+            if lock == "lock":
+                self.resource.lock()
+            elif lock == "lock_context":
+                self.resource.lock_context()
+            elif lock == "lock_excl":
+                self.resource.lock_excl()
+        except:
+            self.response.response_data['result'] = ""
+            self.response.response_data['state'] = "lockError"
+            self.response.status = status.HTTP_200_OK
+            self.close()
+            return self.response
+
+        try:
+            if message:  # without message it is only a read
+                self.resource.write(message)
+                time.sleep(delay)
+            block = self.__read_block(size)
+            values = ct.binary_block_to_array(block, dtype, big_endian)
+        except ImportError as error:
+            self.response.response_data['result'] = str(error)
+            self.response.response_data['state'] = "numpyNotInstalled"
+            self.response.status = status.HTTP_200_OK
+            self.close()
+            return self.response
+        except (ValueError, TypeError) as error:
+            self.response.response_data['result'] = str(error)
+            self.response.response_data['state'] = "binaryBlockError"
+            self.response.status = status.HTTP_200_OK
+            self.close()
+            return self.response
+        except:
+            self.response.response_data['result'] = ""
+            self.response.response_data['state'] = "queryError"
+            self.response.status = status.HTTP_200_OK
+            self.close()
+            return self.response
+
+        if output == 'octet':
+            self.response.binary = values
+            result = ""
+        else:
+            result = base64.b64encode(values.data).decode('ascii')
+        self.response.response_data['dtype'] = values.dtype.str
+        self.response.response_data['count'] = int(values.size)
+
+        try:
+            if lock == "lock" or lock == "lock_context" or lock == "lock_excl":
+                self.resource.unlock()
+        except:
+            self.response.response_data['result'] = result
+            self.response.response_data['state'] = "unlockError"
+            self.response.status = status.HTTP_200_OK
+            return self.response
+
+        self.response.response_data['state'] = "success"
+        self.response.response_data['result'] = result
+        self.response.status = status.HTTP_200_OK
+        self.close()
+        return self.response
+
+    def __read_block(self, size=None):
+        """
+        Read a whole binary block, in as many reads as needed, into a single buffer.
+        :param size: size of every read (the default chunk of the resource if None)
+        :return: a memoryview of the data of the block
+        """
+        buffer = bytearray(self.resource.read_raw(size=size))
+        offset, length = ct.binary_block_header(buffer)
+        if length is None:  # indefinite length, the data finishes with the termination
+            end = len(buffer)
+            while end > offset and buffer[end - 1] in b'\r\n':
+                end -= 1
+        else:
+            end = offset + length
+            while len(buffer) < end:
+                chunk = self.resource.read_raw(size=size)
+                if not chunk:
+                    raise ValueError('The binary block is incomplete')
+                buffer.extend(chunk)
+        return memoryview(buffer)[offset:end]
+
+
+class StreamRawCommandManager(RemoteInstAppManager):
+    """
+    Streaming variant of read_raw and query_raw (if a 'message' is given it is written first). The response is read
+    with the VISA library in chunks of 'chunk_size' bytes (RAW_STREAM_CHUNK_SIZE by default) and it is given to the
+    view as a generator (Response.stream), so every chunk is sent to the client as soon as it arrives and only one
+    chunk is in memory. The chunks are sent as they are ('output': 'octet') or as hex strings ('output': 'hex', like
+    read_raw). The session is held until the generator finishes or it is closed, then it goes back to the pool.
+    """
+    def execute_command(self, data):
+        logger.info("executing streaming raw read to {0}".format(self.instrument.instrumentId))
+        self.setting_visa_attributes(data) # could raise an AttributeError
+        message = data.get('message') or ""
+        delay = data.get('delay', 0)
+        lock = data.get('lock', "")
+        chunk_size = int(data.get('chunk_size') or getattr(settings, 'RAW_STREAM_CHUNK_SIZE', 65536))
+        as_hex = data.get('output', 'octet') == 'hex'
+
+        try:
+            if lock == "lock":
+                self.resource.lock()
+            elif lock == "lock_context":
+                self.resource.lock_context()
+            elif lock == "lock_excl":
+                self.resource.lock_excl()
+        except:
+            self.response.response_data['result'] = ""
+            self.response.response_data['state'] = "lockError"
+            self.response.status = status.HTTP_200_OK
+            self.close()
+            return self.response
+
+        try:
+            if message:
+                self.resource.write_raw(ct.to_byte(message))
+                time.sleep(delay)
+        except:
+            self.response.response_data['result'] = ""
+            self.response.response_data['state'] = "queryError"
+            self.response.status = status.HTTP_200_OK
+            self.close()
+            return self.response
+
+        self.response.response_data['state'] = "success"
+        self.response.response_data['result'] = ""
+        self.response.status = status.HTTP_200_OK
+        self.response.stream = ChunkStream(self.__read_chunks(chunk_size, as_hex), lambda: self.__finish(lock))
+        return self.response
+
+    def __read_chunks(self, chunk_size, as_hex):
+        """
+        Read the response chunk by chunk until the end of the message (END or termination character).
+        """
+        while True:
+            try:
+                chunk, code = self.resource.visalib.read(self.resource.session, chunk_size)
+            except Exception as error:
+                logger.error("Error reading from {0}: {1}".format(self.instrument.instrumentId, error))
+                self.response.response_data['state'] = "readError"
+                raise
+            if chunk:
+                yield ct.to_str(chunk).encode('ascii') if as_hex else chunk
+            if code != v_cons.StatusCode.success_max_count_read:  # there is nothing else to read
+                return
+
+    def __finish(self, lock):
+        """
+        Unlock the instrument and give the session back to the pool, only once.
+        """
+        if self.session is None:
+            return
+        try:
+            if lock == "lock" or lock == "lock_context" or lock == "lock_excl":
+                self.resource.unlock()
+        except:
+            self.response.response_data['state'] = "unlockError"
+        self.close()
+
+
+class ChunkStream(object):
+    """
+    Iterable of the chunks of a streamed response. The web server calls close() when the response finishes, even if
+    the client went away before the first chunk (a generator that has not started does not run its finally clauses),
+    so on_close always runs.
+    """
+    def __init__(self, chunks, on_close):
+        self.chunks = chunks
+        self.on_close = on_close
+        self.closed = False
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            yield chunk
+        self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.chunks.close()
+        self.on_close()
@@ -0,0 +1,318 @@
+"""
+Execution of a single direct command (the /v1/instruments/<id>/commands/... endpoints) against an instrument. It is
+used by the views, synchronously, and by the command jobs (see remoteinstrapp.app_management.jobs).
+"""
+__author__ = 'macastro'
+
+import base64
+import logging
+import threading
+import time
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import connection
+from rest_framework import status as st
+
+from remoteinstrapp.app_management import manager
+from remoteinstrapp.app_management.executor import callable_manager_map
+from remoteinstrapp.exceptions import OpenInstrumentError, NoBackendError
+
+# Get an instance of a logger
+logger = logging.getLogger(__name__)
+
+# Map for choose the correct manager
+manager_types = {
+    "WriteRawCommandManager":manager.WriteRawCommandManager,
+    "QueryInstrumentManager":manager.QueryInstrumentManager,
+    "QueryRawInstrumentManager":manager.QueryRawInstrumentManager,
+    "ReadRawCommandManager":manager.ReadRawCommandManager,
+    "ReadCommandManager":manager.ReadCommandManager,
+    "WriteCommandManager":manager.WriteCommandManager,
+    "GetVisaAttributeCommandManager":manager.GetVisaAttributeCommandManager,
+    "QueryBinaryValuesManager":manager.QueryBinaryValuesManager,
+    "StreamRawCommandManager":manager.StreamRawCommandManager,
+    "RemoteInstAppManager":manager.RemoteInstAppManager,  # only opens the instrument (batches)
+}
+
+LOCK_TYPES = ("lock", "lock_context", "lock_excl")
+
+_fanout_lanes = 0  # lanes (threads) of the fan-out queries running in this process
+_fanout_lock = threading.Lock()
+
+
+def open_manager(instrumentId, manager_type):
+    """
+    Create the proper manager wrapper (opening the instrument)
+    :param instrumentId: the instrumentId of the instrument
+    :param manager_type: key of manager_types
+    :return: a tuple (manager, http state, state, result). The manager is None if it could not be opened and the rest
+    describe the error
+    """
+    mng = None
+    result = ''
+    state = ''
+    http_state = None
+    try: # to call the proper instrument manager
+        mng = manager_types[manager_type](instrumentId)
+
+    except ImportError as error: # if pyvisa is not installed
+        http_state = st.HTTP_500_INTERNAL_SERVER_ERROR
+        state = 'pyVisaNotInstalled'
+        result = str(error)
+    except ObjectDoesNotExist as error:
+        http_state = st.HTTP_404_NOT_FOUND
+        state='instrumentNotExists'
+        result = str(error)
+    except ValueError as error: # raise when the user set a bad backend, not in the oficial list of backends
+        http_state = st.HTTP_400_BAD_REQUEST
+        state='wrongBackendConfigured'
+        result = str(error)
+    except NoBackendError as error: # The backend in data is not installed in the computer
+        http_state = st.HTTP_500_INTERNAL_SERVER_ERROR
+        state='noBackendError'
+        result = str(error)
+    except OpenInstrumentError as error: # The instrument in data is not connected to the computer
+        http_state = st.HTTP_500_INTERNAL_SERVER_ERROR
+        state='openInstrumentError'
+        result = str(error)
+    except OSError as error: #if the backend is not installed
+        http_state = st.HTTP_500_INTERNAL_SERVER_ERROR
+        state ='oserror'
+        result = str(error)
+    except AttributeError as error: # due to visaParameter_string or visaParameter_numeric assignement
+            http_state = st.HTTP_500_INTERNAL_SERVER_ERROR
+            state = 'pyVisaParametersError'
+            result = str(error)
+    except Exception as error: # another exception that we do not know previously
+        state = 'unknownError'
+        http_state = st.HTTP_500_INTERNAL_SERVER_ERROR
+        result = str(error)
+
+    return mng, http_state, state, result
+
+
+def run_command(instrumentId, manager_type, data):
+    """
+    Open the instrument, execute a command and give the session back to the pool.
+    :param instrumentId: the instrumentId of the instrument
+    :param manager_type: key of manager_types
+    :param data: dict with the parameters of the command (see the execute_command of the managers)
+    :return: a tuple (dict with state, result and the extra information of the result, http state, binary values).
+    The binary values are the array of query_binary_values with 'output': 'octet', None otherwise
+    """
+    rest_response = {}
+    binary = None
+    mng, http_state, state, result = open_manager(instrumentId, manager_type)
+
+    #we execute the command
+    if not http_state:
+        try:
+            response = mng.execute_command(data)
+            http_state = response.status
+            state = response.response_data['state']
+            result= response.response_data['result']
+            # extra information of the result (e.g. dtype and count of the binary values)
+            rest_response.update((key, value) for key, value in response.response_data.items()
+                                 if key not in ('state', 'result'))
+            if response.binary is not None and state == 'success':
+                binary = response.binary
+
+        except AttributeError as error: # due to visaAttributes_string or visaAttributes_numeric assignement
+            http_state = st.HTTP_400_BAD_REQUEST
+            state = 'VisaAttributesError'
+            result = str(error)
+        finally: # the session always goes back to the pool, even if the manager did not close it
+            mng.close()
+
+    rest_response['state'] = state
+    rest_response['result'] = result
+    return rest_response, http_state, binary
+
+
+def validate_batch(commands):
+    """
+    :param commands: list of dicts with the 'method' (see executor.callable_manager_map) and the parameters of the
+    commands
+    :return: the error of the batch or None if it is right
+    """
+    if not isinstance(commands, list) or not commands:
+        return 'commands must be a non empty list'
+    if len(commands) > getattr(settings, 'BATCH_MAX_COMMANDS', 50):
+        return 'too many commands, the maximum is {0}'.format(getattr(settings, 'BATCH_MAX_COMMANDS', 50))
+    for index, command in enumerate(commands):
+        if not isinstance(command, dict) or command.get('method') not in callable_manager_map:
+            return 'command {0}: method not supported'.format(index)
+    return None
+
+
+def run_batch(instrumentId, commands, lock="", stop_on_error=True):
+    """
+    Execute several commands in order on a single session of the instrument: it is opened once and locked once (the
+    lock of every command is ignored). Every command is executed by its specific manager sharing the session, like
+    the tasks (see executor.TaskExecutor), and its visaAttributes are restored after it.
+    :param instrumentId: the instrumentId of the instrument
+    :param commands: list of dicts with the 'method' and the parameters of the command (see validate_batch)
+    :param lock: lock of the whole batch ('lock', 'lock_context', 'lock_excl' or '')
+    :param stop_on_error: True to skip the rest of the commands once one fails
+    :return: a tuple (dict with the state of the batch and the results of the commands, http state)
+    """
+    mng, http_state, state, result = open_manager(instrumentId, 'RemoteInstAppManager')
+    if http_state:
+        return {'state': state, 'result': result}, http_state
+
+    results = []
+    failed = False
+    try:
+        try:
+            if lock in LOCK_TYPES:
+                getattr(mng.resource, lock)()
+        except Exception as error:
+            failed = True
+            return {'state': 'lockError', 'result': str(error)}, st.HTTP_200_OK
+
+        for index, data in enumerate(commands):
+            if failed and stop_on_error:
+                results.append({'index': index, 'method': data['method'], 'state': 'skipped', 'result': ''})
+                continue
+            command_result = run_shared_command(mng, index, data)
+            failed = failed or command_result['state'] != 'success'
+            results.append(command_result)
+
+        if lock in LOCK_TYPES:
+            try:
+                mng.resource.unlock()
+            except Exception as error:
+                failed = True
+                return {'state': 'unlockError', 'result': str(error), 'results': results}, st.HTTP_200_OK
+    finally:
+        mng.close(discard=failed)
+
+    return {'state': 'error' if failed else 'success', 'results': results}, st.HTTP_200_OK
+
+
+def run_shared_command(mng, index, data):
+    """
+    Execute a command of a batch on the session of mng.
+    :return: dict with the index, method, state, result (and its extra information) and elapsed seconds
+    """
+    method = data['method']
+    data = dict((key, value) for key, value in data.items() if key not in ('method', 'lock'))
+    start = time.time()
+    command_result = {}
+    try:
+        response = callable_manager_map[method](mng.instrument.instrumentId, shared=mng).execute_command(data)
+        command_result.update(response.response_data)
+        if response.binary is not None: # there is no octet stream in the json of the batch
+            command_result['result'] = base64.b64encode(response.binary.tobytes()).decode('ascii')
+    except AttributeError as error: # due to visaAttributes_string or visaAttributes_numeric assignement
+        command_result.update(state='VisaAttributesError', result=str(error))
+    except Exception as error:
+        logger.error("Error in command {0} ({1}) of the batch: {2}".format(index, method, error))
+        command_result.update(state='unknownError', result=str(error))
+    finally:
+        # the visaAttributes of a command must not be inherited by the next one
+        try:
+            mng.session.restore_attributes()
+        except Exception as error:
+            logger.warning("The visa attributes could not be restored: {0}".format(error))
+    command_result.update(index=index, method=method, elapsed=round(time.time() - start, 6))
+    return command_result
+
+
+def run_fanout(instrumentIds, method, data, deadline):
+    """
+    Execute the same command on several instruments concurrently, one lane (thread) per instrument, and return
+    what has finished when the deadline expires. The commands still running go on in the background and give their
+    sessions back to the pool when they finish.
+    :param instrumentIds: list of instrumentIds
+    :param method: the method of the command (see executor.callable_manager_map)
+    :param data: dict with the parameters of the command
+    :param deadline: seconds to wait for all the instruments
+    :return: dict with the state ('success', 'partial' if any instrument failed or did not finish, 'error' if none went
+    well), the elapsed seconds and the result and latency of every instrument, in the order given. None if the
+    lanes would exceed FANOUT_MAX_LANES in this process (the query is not executed)
+    """
+    manager_type = callable_manager_map[method].__name__
+    start = time.time()
+    instrumentIds = list(OrderedDict.fromkeys(instrumentIds))
+    if not reserve_lanes(len(instrumentIds)):
+        logger.warning("Fan-out to {0} instruments rejected, too many lanes running".format(len(instrumentIds)))
+        return None
+    # Every request has its own pool with one thread per instrument: all its lanes run at once, and the lanes
+    # abandoned by an earlier request after its deadline do not take the threads of the next ones
+    executor = ThreadPoolExecutor(max_workers=max(len(instrumentIds), 1))
+    futures = OrderedDict()
+    try:
+        for instrumentId in instrumentIds:
+            futures[instrumentId] = executor.submit(run_lane, instrumentId, manager_type, dict(data))
+            futures[instrumentId].add_done_callback(release_lane)
+        wait(futures.values(), timeout=deadline)
+    finally:
+        executor.shutdown(wait=False)
+        release_lanes(len(instrumentIds) - len(futures))  # the ones not submitted
+
+    results = []
+    for instrumentId, future in futures.items():
+        if future.done():
+            rest_response, http_state, latency = future.result()
+            rest_response.update(instrumentId=instrumentId, httpStatus=http_state, latency=latency)
+        else:
+            rest_response = {'instrumentId': instrumentId, 'state': 'deadlineExceeded', 'result': '',
+                             'httpStatus': None, 'latency': None}
+        results.append(rest_response)
+
+    successes = sum(1 for result in results if result['state'] == 'success')
+    state = 'success' if successes == len(results) else 'partial' if successes else 'error'
+    return {'state': state, 'elapsed': round(time.time() - start, 6), 'results': results}
+
+
+def reserve_lanes(count):
+    """
+    Reserve count lanes of the fan-out queries, all or none, without exceeding FANOUT_MAX_LANES in this process. The
+    lanes abandoned after a deadline keep their reservation until they finish.
+    :return: True if they have been reserved
+    """
+    global _fanout_lanes
+    with _fanout_lock:
+        if _fanout_lanes + count > getattr(settings, 'FANOUT_MAX_LANES', 200):
+            return False
+        _fanout_lanes += count
+        return True
+
+
+def release_lanes(count):
+    """
+    Give back count lanes reserved with reserve_lanes
+    """
+    global _fanout_lanes
+    with _fanout_lock:
+        _fanout_lanes -= count
+
+
+def release_lane(future):
+    """
+    Done callback of the future of a lane
+    """
+    release_lanes(1)
+
+
+def run_lane(instrumentId, manager_type, data):
+    """
+    run_command in a thread of the fan-out pool, the database connection of the thread is closed at the end.
+    :return: a tuple (dict with the response, http state, latency in seconds)
+    """
+    start = time.time()
+    try:
+        rest_response, http_state, binary = run_command(instrumentId, manager_type, data)
+        if binary is not None: # there is no octet stream in the json of the fan-out
+            rest_response['result'] = base64.b64encode(binary.tobytes()).decode('ascii')
+    except Exception as error:
+        logger.error("Error in the fan-out to {0}: {1}".format(instrumentId, error))
+        rest_response, http_state = {'state': 'unknownError', 'result': str(error)}, st.HTTP_500_INTERNAL_SERVER_ERROR
+    finally:
+        connection.close()
+    return rest_response, http_state, round(time.time() - start, 6)
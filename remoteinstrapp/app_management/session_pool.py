@@ -0,0 +1,238 @@
+"""
+This module keeps a process-wide pool of open PyVisa sessions, one per physical instrument (backend + visaId).
+Opening a resource is frequently more expensive than the command itself (GPIB, TCPIP), so the managers borrow an
+already opened session from here and give it back when they finish instead of closing it.
+"""
+__author__ = 'macastro'
+
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from remoteinstrapp import exceptions
+from remoteinstrapp.app_management import backends
+
+# Get an instance of a logger
+logger = logging.getLogger(__name__)
+
+
+class PooledSession(object):
+    """
+    An open PyVisa resource and the (shared) ResourceManager of its backend. Only one client at a time can use a
+    session, the lock of the session is held from acquire to release.
+    """
+    def __init__(self, backend, visaId):
+        self.key = (backend, visaId)
+        self.backend = backend
+        self.visaId = visaId
+        self.resource_manager = None
+        self.resource = None
+        self.pooled = True
+        self.last_used = time.time()
+        self.lock = threading.Lock()
+        self.overridden_attributes = {}
+
+    def open(self):
+        """
+        Attempt to opening the Pyvisa backend and the Pyvisa resource
+        """
+        self.resource_manager = backends.get_resource_manager(self.backend)
+        try:
+            logger.debug('Trying to open resource "{0}" ...'.format(self.visaId))
+            self.resource = self.resource_manager.open_resource(self.visaId)
+            logger.debug('OK')
+        except OSError as error:
+            self.close()
+            raise exceptions.OpenInstrumentError(error)
+        except Exception:
+            self.close()
+            raise
+
+    def is_alive(self):
+        """
+        Health check of the session. A resource that has been closed (locally or by the library) has no session.
+        """
+        if self.resource is None:
+            return False
+        try:
+            return self.resource.session is not None
+        except Exception:
+            return False
+
+    def set_attribute(self, name, value):
+        """
+        Set a VISA attribute that only makes sense for the current client. The original value is remembered in order
+        to restore it when the session goes back to the pool.
+        """
+        if name not in self.overridden_attributes:
+            self.overridden_attributes[name] = getattr(self.resource, name, None)
+        setattr(self.resource, name, value)
+
+    def restore_attributes(self):
+        """
+        Undo all the changes done by set_attribute
+        """
+        for name, value in self.overridden_attributes.items():
+            if value is not None:
+                setattr(self.resource, name, value)
+        self.overridden_attributes = {}
+
+    def close(self):
+        """
+        Close the resource, ignoring the errors since the session is dropped anyway. The resource manager is shared
+        with other sessions so it remains open.
+        """
+        if self.resource is not None:
+            try:
+                self.resource.close()
+            except Exception as exc:
+                logger.warning('Error closing session of "{0}": {1}'.format(self.visaId, exc))
+        self.resource = None
+        self.resource_manager = None
+        self.overridden_attributes = {}
+
+
+class SessionPool(object):
+    """
+    Bounded pool of PooledSession keyed by (backend, visaId). There is only one session per instrument in the pool at
+    any time, so the clients of a device are serialized by the lock of its session.
+    - Idle sessions are closed after idle_timeout seconds without use.
+    - When the pool is full the least recently used idle session is evicted. If every session is busy, the new one
+      is served without being pooled (it is closed and removed on release).
+    - A session that failed (discard=True on release) is closed and reopened by the next client.
+    The sessions are closed (VISA I/O) out of the lock of the pool, holding only their own lock.
+    """
+    def __init__(self, max_size, idle_timeout, acquire_timeout):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.acquire_timeout = acquire_timeout
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, backend, visaId):
+        """
+        Borrow the session of an instrument, opening it if it is needed. It blocks while another client is
+        using the same instrument, so the commands for a device are always serialized.
+        :param backend: the pyvisa backend used
+        :param visaId: the visa resource name of the instrument
+        :return: a PooledSession whose resource is open
+        """
+        key = (backend, visaId)
+        deadline = time.time() + self.acquire_timeout
+        while True:
+            reserved = False
+            with self.lock:
+                evicted = self.__evict_idle()
+                session = self.sessions.get(key)
+                if session is None:
+                    session = PooledSession(backend, visaId)
+                    session.pooled = self.__make_room(evicted)
+                    session.lock.acquire()  # nobody else knows it yet, reserved before the pool is unlocked
+                    self.sessions[key] = session
+                    reserved = True
+            self.__close_sessions(evicted)
+
+            if not reserved and not session.lock.acquire(timeout=max(deadline - time.time(), 0)):
+                raise exceptions.OpenInstrumentError(
+                    'Timeout waiting for the instrument "{0}", it is being used by another client'.format(visaId))
+            with self.lock:
+                if self.sessions.get(key) is session:
+                    break
+            # it was evicted or dropped while waiting for it, it is closed so try again with the current one
+            session.lock.release()
+
+        try:
+            if session.resource is not None and not session.is_alive():
+                logger.warning('Session of "{0}" is not alive, reopening it'.format(visaId))
+                session.close()
+            if session.resource is None:
+                session.open()
+            else:
+                logger.debug('Reusing the open session of "{0}"'.format(visaId))
+        except Exception:
+            self.release(session, discard=True)
+            raise
+        return session
+
+    def release(self, session, discard=False):
+        """
+        Give back a session to the pool.
+        :param session: the session returned by acquire
+        :param discard: True if the session could be in a wrong state (I/O error, lock error...) and must be closed
+        """
+        if not discard:
+            try:
+                session.restore_attributes()
+            except Exception as exc:
+                logger.warning('Visa attributes of "{0}" could not be restored: {1}'.format(session.visaId, exc))
+                discard = True
+        with self.lock:
+            pooled = session.pooled and self.sessions.get(session.key) is session
+        if discard or not pooled:
+            session.close()
+        session.last_used = time.time()
+        if not pooled:
+            with self.lock:
+                if self.sessions.get(session.key) is session:
+                    del self.sessions[session.key]
+        session.lock.release()
+
+    def close_all(self):
+        """
+        Close all the idle sessions of the pool (used at shutdown)
+        """
+        with self.lock:
+            idle = [session for session in self.sessions.values() if session.lock.acquire(False)]
+        self.__close_sessions(idle)
+
+    def __close_sessions(self, sessions):
+        """
+        Close sessions whose lock is held by this thread, remove them from the pool and release them. The clients
+        waiting for them find out that they are not in the pool anymore and take a new one.
+        """
+        for session in sessions:
+            session.close()
+            with self.lock:
+                if self.sessions.get(session.key) is session:
+                    del self.sessions[session.key]
+            session.lock.release()
+
+    def __evict_idle(self):
+        """
+        Take (lock) the sessions idle for more than idle_timeout seconds, they are closed out of the lock of the pool.
+        """
+        limit = time.time() - self.idle_timeout
+        evicted = []
+        for session in list(self.sessions.values()):
+            if session.last_used < limit and session.lock.acquire(False):
+                logger.debug('Closing idle session of "{0}"'.format(session.visaId))
+                evicted.append(session)
+        return evicted
+
+    def __make_room(self, evicted):
+        """
+        :param evicted: sessions already taken to be closed, another one is added if the pool is full
+        :return: True if a new session fits in the pool
+        """
+        if len(self.sessions) - len(evicted) < self.max_size:
+            return True
+        idle = [s for s in self.sessions.values() if s not in evicted and not s.lock.locked()]
+        for session in sorted(idle, key=lambda s: s.last_used):
+            if session.lock.acquire(False):
+                logger.debug('Session pool is full, evicting "{0}"'.format(session.visaId))
+                evicted.append(session)
+                return True
+        logger.warning('Session pool is full and all the sessions are in use, the new one will not be pooled')
+        return False
+
+
+# The pool shared by the views and the celery tasks of this process
+session_pool = SessionPool(
+    getattr(settings, 'VISA_SESSION_POOL_MAX_SIZE', 16),
+    getattr(settings, 'VISA_SESSION_POOL_IDLE_TIMEOUT', 300),
+    getattr(settings, 'VISA_SESSION_POOL_ACQUIRE_TIMEOUT', 60),
+)
+
+atexit.register(session_pool.close_all)
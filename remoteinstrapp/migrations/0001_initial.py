@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Capability',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('name', models.CharField(max_length=100)),
+                ('value', models.CharField(max_length=100)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Characteristics',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('name', models.CharField(max_length=100)),
+                ('value', models.CharField(max_length=100)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Command',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('commandId', models.CharField(max_length=50, blank=True)),
+                ('seqNumber', models.IntegerField()),
+                ('method', models.CharField(max_length=50)),
+                ('message', models.CharField(max_length=1000, null=True, blank=True)),
+                ('delay', models.FloatField(default=0.0, blank=True)),
+                ('termination', models.CharField(max_length=50, default='\r\n', blank=True)),
+                ('encoding', models.CharField(max_length=50, default='ascii', blank=True)),
+                ('size', models.IntegerField(default=20480, blank=True)),
+                ('name', models.CharField(max_length=50, null=True, blank=True)),
+                ('lock', models.CharField(max_length=50, blank=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Config',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('countryId', models.CharField(max_length=50)),
+                ('appId', models.CharField(max_length=50)),
+                ('defaultBackend', models.CharField(max_length=50)),
+                ('broker', models.CharField(max_length=50)),
+                ('backend', models.CharField(max_length=50)),
+                ('dataFormat', models.CharField(max_length=50)),
+                ('timezone', models.CharField(max_length=50)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Instrument',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('instrumentId', models.CharField(max_length=50, unique=True)),
+                ('visaId', models.CharField(max_length=255)),
+                ('backend', models.CharField(max_length=50, default='@py')),
+                ('description', models.CharField(max_length=255, null=True, blank=True)),
+                ('interface', models.CharField(max_length=50, null=True, blank=True)),
+                ('protocol', models.CharField(max_length=50, null=True, blank=True)),
+                ('active', models.BooleanField(default=False)),
+                ('externalURI', models.CharField(max_length=1000, null=True, blank=True)),
+                ('taskInterval', models.IntegerField(default=60000, blank=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PyVisaParameter_Numeric',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('name', models.CharField(max_length=100)),
+                ('state', models.FloatField(default=0.0)),
+                ('instrument', models.ForeignKey(related_name='pyvisaParameters_numeric', to='remoteinstrapp.Instrument')),
+            ],
+            options={
+                'ordering': ['name'],
+                'select_on_save': True,
+            },
+        ),
+        migrations.CreateModel(
+            name='PyVisaParameter_String',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('name', models.CharField(max_length=100)),
+                ('state', models.CharField(max_length=100)),
+                ('isConstant', models.BooleanField(default=False)),
+                ('instrument', models.ForeignKey(related_name='pyvisaParameters_string', to='remoteinstrapp.Instrument')),
+            ],
+            options={
+                'ordering': ['name'],
+                'select_on_save': True,
+            },
+        ),
+        migrations.CreateModel(
+            name='Task',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('taskId', models.CharField(max_length=50)),
+                ('description', models.CharField(max_length=255, null=True, blank=True)),
+                ('parameterName', models.CharField(max_length=50)),
+                ('user', models.CharField(max_length=255)),
+                ('retries', models.IntegerField(default=0, blank=True)),
+                ('priority', models.IntegerField(default=0, blank=True)),
+                ('active', models.BooleanField(default=True)),
+                ('instrument', models.ForeignKey(related_name='tasks', to='remoteinstrapp.Instrument')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='VisaAtributes_Numeric',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('name', models.CharField(max_length=100)),
+                ('state', models.FloatField(default=0.0)),
+                ('command', models.ForeignKey(related_name='visaAttributes_numeric', to='remoteinstrapp.Command')),
+            ],
+            options={
+                'ordering': ['name'],
+                'select_on_save': True,
+            },
+        ),
+        migrations.CreateModel(
+            name='VisaAttributes_String',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('name', models.CharField(max_length=100)),
+                ('state', models.CharField(max_length=100)),
+                ('isConstant', models.BooleanField(default=False)),
+                ('command', models.ForeignKey(related_name='visaAttributes_string', to='remoteinstrapp.Command')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='command',
+            name='task',
+            field=models.ForeignKey(related_name='commands', to='remoteinstrapp.Task'),
+        ),
+        migrations.AddField(
+            model_name='characteristics',
+            name='instrument',
+            field=models.ForeignKey(related_name='characteristics', to='remoteinstrapp.Instrument'),
+        ),
+        migrations.AddField(
+            model_name='capability',
+            name='instrument',
+            field=models.ForeignKey(related_name='capabilities', to='remoteinstrapp.Instrument'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='task',
+            unique_together=set([('taskId', 'instrument')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='command',
+            unique_together=set([('seqNumber', 'task')]),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('remoteinstrapp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='parser',
+            field=models.CharField(max_length=20, choices=[('text', 'Only text'), ('float', 'Decimal number'), ('int', 'Integer number'), ('hex_be', 'Unsigned integer, hex string big endian'), ('hex_le', 'Unsigned integer, hex string little endian')], default='text', blank=True),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='unit',
+            field=models.CharField(max_length=20, default='', blank=True),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('remoteinstrapp', '0002_task_parser'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('jobId', models.CharField(max_length=32, unique=True)),
+                ('instrumentId', models.CharField(max_length=50)),
+                ('managerType', models.CharField(max_length=50)),
+                ('data', models.TextField()),
+                ('state', models.CharField(max_length=10, choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done')], default='pending')),
+                ('httpStatus', models.IntegerField(null=True, blank=True)),
+                ('result', models.TextField(blank=True, default='')),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('started', models.DateTimeField(null=True, blank=True)),
+                ('finished', models.DateTimeField(null=True, blank=True)),
+            ],
+        ),
+    ]
@@ -88,8 +88,16 @@ class Characteristics(models.Model):
 class Task(models.Model):
     """
     It represents a task. Really it is a configuration for real tasks queued on celery,
+    The parser says how the numeric value of the result is obtained (see convert_tools.parse_number)
     @author: dcallejo
     """
+    PARSER_CHOICES = (
+        ('text', 'Only text'),
+        ('float', 'Decimal number'),
+        ('int', 'Integer number'),
+        ('hex_be', 'Unsigned integer, hex string big endian'),
+        ('hex_le', 'Unsigned integer, hex string little endian'),
+    )
     taskId = models.CharField(max_length=50)
     description = models.CharField(max_length=255,null=True, blank=True)
     parameterName = models.CharField(max_length=50)
@@ -98,6 +106,8 @@ class Task(models.Model):
     priority = models.IntegerField(default=0, blank=True)
     active = models.BooleanField(default=True)
     instrument = models.ForeignKey(Instrument, related_name='tasks')
+    parser = models.CharField(max_length=20, choices=PARSER_CHOICES, default='text', blank=True)
+    unit = models.CharField(max_length=20, default='', blank=True)
 
     class Meta:
         unique_together = ('taskId', 'instrument',)
@@ -180,3 +190,29 @@ class Config(models.Model):
         return '{0}'.format(self.idCountry)
 
 
+
+
+class Job(models.Model):
+    """
+    A direct command executed asynchronously (?async=true). It is created by the view, executed by a celery worker (or
+    a thread of the web server, see COMMAND_JOBS_BACKEND) and polled by the client in /v1/jobs/<jobId>/
+    @author: macastro
+    """
+    STATE_CHOICES = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+    )
+    jobId = models.CharField(max_length=32, unique=True)
+    instrumentId = models.CharField(max_length=50)
+    managerType = models.CharField(max_length=50)
+    data = models.TextField()  # json of the parameters of the command
+    state = models.CharField(max_length=10, choices=STATE_CHOICES, default='pending')
+    httpStatus = models.IntegerField(null=True, blank=True)  # of the command, as it would be returned synchronously
+    result = models.TextField(blank=True, default='')  # json of the response of the command
+    created = models.DateTimeField(auto_now_add=True, db_index=True)  # clean_jobs
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return '{0}'.format(self.jobId)
@@ -408,6 +408,8 @@ class TaskSerializer(serializers.ModelSerializer):
                   'retries',
                   'priority',
                   'active',
+                  'parser',
+                  'unit',
                   'commands'
 
     """
@@ -422,6 +424,8 @@ class TaskSerializer(serializers.ModelSerializer):
                   'retries',
                   'priority',
                   'active',
+                  'parser',
+                  'unit',
                   'commands'
                   )
 
@@ -463,6 +467,8 @@ class TaskSerializer(serializers.ModelSerializer):
         instance.retries = validated_data.get('retries', instance.retries)
         instance.priority = validated_data.get('priority', instance.priority)
         instance.active = validated_data.get('active', instance.active)
+        instance.parser = validated_data.get('parser', instance.parser)
+        instance.unit = validated_data.get('unit', instance.unit)
         instance.save()
         #commands_data = validated_data.pop('commands', {})
         # for c_data in commands_data:
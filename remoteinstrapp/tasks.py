@@ -0,0 +1,32 @@
+from __future__ import absolute_import
+
+__author__ = 'macastro'
+
+import logging
+
+from celery import shared_task
+from django.conf import settings
+from remoteinstrapp.app_management import jobs
+
+# Get an instance of a logger
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def execute_job(jobId):
+    """
+    Execute a direct command submitted asynchronously (see remoteinstrapp.app_management.jobs).
+    """
+    return jobs.run_job(jobId)
+
+
+@shared_task
+def clean_jobs():
+    """
+    Remove the jobs older than COMMAND_JOBS_RETENTION hours, their results have already been read or abandoned, and
+    mark as failed the ones not finished in COMMAND_JOBS_STALE_TIMEOUT seconds.
+    """
+    jobs.fail_stale_jobs(getattr(settings, 'COMMAND_JOBS_STALE_TIMEOUT', 600))
+    count = jobs.clean_jobs(getattr(settings, 'COMMAND_JOBS_RETENTION', 24))
+    if count:
+        logger.info("Has been deleted {0} jobs".format(count))
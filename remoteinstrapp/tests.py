@@ -1,4 +1,592 @@
-from django.test import TestCase
+import base64
+import gzip
+import json
+import struct
+import threading
+import unittest
+from concurrent.futures import FIRST_COMPLETED, wait
+
+import django.test
+from mock import patch, Mock
+
+from django.conf import settings
+from django.utils import timezone
+from remoteinstrapp import exceptions
+from remoteinstrapp.models import Instrument, Job
+from remoteinstrapp.app_management import manager, jobs, runner
+from remoteinstrapp.app_management.session_pool import SessionPool
+from remoteinstrapp.app_management.executor import TaskExecutor, CompiledCommand
+from remoteinstrapp.utils import convert_tools as ct
+from remoteinstrapp.utils.dates import parse_date
+from remoteinstrapp.views import measurement_views
+from remoteinstrapp.utils.downsampling import lttb
+
+from daemonsceleryapp import export
+from daemonsceleryapp.models import TempData
+from daemonsceleryapp.buffer import MeasurementBuffer
+from daemonsceleryapp.management.commands import export_measurements
 
 # Create your tests here.
 
+
+class A_SessionPoolTestCase(django.test.SimpleTestCase):
+    """
+    Test batteries for the pool of open PyVisa sessions
+    """
+    def setUp(self):
+        self.resource_manager = Mock()
+        self.resource_manager.open_resource.side_effect = lambda visaId: Mock(name=visaId)
+        patcher = patch('remoteinstrapp.app_management.backends.get_resource_manager',
+                        return_value=self.resource_manager)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pool = SessionPool(max_size=2, idle_timeout=300, acquire_timeout=0.05)
+
+    def test_reuse(self):
+        """
+        The session of an instrument is opened once and reused by the next clients
+        """
+        session = self.pool.acquire('@py', 'GPIB::1')
+        resource = session.resource
+        self.pool.release(session)
+        self.assertIs(self.pool.acquire('@py', 'GPIB::1'), session)
+        self.assertIs(session.resource, resource)
+        self.assertEqual(self.resource_manager.open_resource.call_count, 1)
+        self.assertFalse(resource.close.called)
+
+    def test_discard(self):
+        """
+        A session released with discard is closed and opened again by the next client
+        """
+        session = self.pool.acquire('@py', 'GPIB::1')
+        resource = session.resource
+        self.pool.release(session, discard=True)
+        resource.close.assert_called_once_with()
+        self.assertIsNot(self.pool.acquire('@py', 'GPIB::1').resource, resource)
+
+    def test_serialization(self):
+        """
+        Only one client at a time uses an instrument, the next one waits for it (and times out here)
+        """
+        session = self.pool.acquire('@py', 'GPIB::1')
+        self.assertRaises(exceptions.OpenInstrumentError, self.pool.acquire, '@py', 'GPIB::1')
+        other = self.pool.acquire('@py', 'GPIB::2')  # other instruments are not blocked
+        self.pool.release(session)
+        self.pool.release(other)
+        self.assertIs(self.pool.acquire('@py', 'GPIB::1'), session)
+
+    def test_evicted_while_waiting(self):
+        """
+        A client waiting for a session that is removed from the pool meanwhile takes the new one, it never reopens
+        the removed session
+        """
+        session = self.pool.acquire('@py', 'GPIB::1')
+        self.pool.acquire_timeout = 5
+        acquired = []
+        waiting = threading.Thread(target=lambda: acquired.append(self.pool.acquire('@py', 'GPIB::1')))
+        waiting.start()
+        session.pooled = False  # dropped on release, as if it had been evicted
+        self.pool.release(session)
+        waiting.join(5)
+        self.assertIsNot(acquired[0], session)
+        self.assertIsNone(session.resource)
+        self.assertIs(self.pool.sessions[('@py', 'GPIB::1')], acquired[0])
+
+    def test_idle_eviction(self):
+        session = self.pool.acquire('@py', 'GPIB::1')
+        resource = session.resource
+        self.pool.release(session)
+        session.last_used -= 301
+        self.pool.release(self.pool.acquire('@py', 'GPIB::2'))
+        resource.close.assert_called_once_with()
+        self.assertEqual(list(self.pool.sessions), [('@py', 'GPIB::2')])
+
+    def test_full_pool(self):
+        """
+        The least recently used idle session is evicted to make room. If all of them are busy the new session is not
+        pooled
+        """
+        first = self.pool.acquire('@py', 'GPIB::1')
+        self.pool.release(first)
+        second = self.pool.acquire('@py', 'GPIB::2')
+        third = self.pool.acquire('@py', 'GPIB::3')
+        self.assertIsNone(first.resource)
+        self.assertTrue(third.pooled)
+
+        unpooled = self.pool.acquire('@py', 'GPIB::4')
+        resource = unpooled.resource
+        self.assertFalse(unpooled.pooled)
+        self.pool.release(unpooled)
+        resource.close.assert_called_once_with()
+        self.assertEqual(sorted(self.pool.sessions), [('@py', 'GPIB::2'), ('@py', 'GPIB::3')])
+        self.pool.release(second)
+        self.pool.release(third)
+
+
+class B_TaskExecutorTestCase(django.test.SimpleTestCase):
+    """
+    Test batteries for the execution of the tasks on one open session
+    """
+    def setUp(self):
+        self.session = Mock()
+        self.session.set_attribute.side_effect = lambda name, value: setattr(self.session.resource, name, value)
+        self.session.resource.query.return_value = '1.25'
+        patcher = patch('remoteinstrapp.app_management.manager.session_pool')
+        self.pool = patcher.start()
+        self.pool.acquire.return_value = self.session
+        self.addCleanup(patcher.stop)
+        self.instrument = Instrument(instrumentId='IntsPrueba', backend='@py', visaId='GPIB::1')
+        self.task = Mock(taskId='t1', retries=1)
+        self.commands = [CompiledCommand('c1', 'write', {'message': 'CONF:VOLT'}, (('timeout', 5000),)),
+                         CompiledCommand('c2', 'query', {'message': 'MEAS:VOLT?'}, ())]
+
+    def test_one_session(self):
+        """
+        All the commands of the tasks run on the session opened once, the attributes of every command are restored
+        """
+        executor = TaskExecutor('IntsPrueba', instrument=self.instrument, parameters=())
+        self.assertEqual(executor.run(self.task, self.commands).response_data['result'], '1.25')
+        self.assertEqual(executor.run(self.task, self.commands).response_data['result'], '1.25')
+        executor.close()
+        self.pool.acquire.assert_called_once_with('@py', 'GPIB::1')
+        self.session.set_attribute.assert_called_with('timeout', 5000)
+        self.assertEqual(self.session.restore_attributes.call_count, 4)
+        self.pool.release.assert_called_once_with(self.session, discard=False)
+
+    def test_failure(self):
+        """
+        A failed sequence is retried on the same session, which is discarded at the end
+        """
+        self.session.resource.query.side_effect = IOError('timeout')
+        executor = TaskExecutor('IntsPrueba', instrument=self.instrument, parameters=())
+        self.assertIsNone(executor.run(self.task, self.commands))
+        executor.close()
+        self.assertEqual(self.session.resource.query.call_count, 2)  # the first try and one retry
+        self.assertEqual(self.session.restore_attributes.call_count, 4)
+        self.pool.acquire.assert_called_once_with('@py', 'GPIB::1')
+        self.pool.release.assert_called_once_with(self.session, discard=True)
+
+
+class C_MeasurementsApiTestCase(django.test.TestCase):
+    """
+    Test batteries for the read API of the measurements
+    """
+    def setUp(self):
+        """
+        Populate the data base with 120 numeric measurements, one per second, and their rollups
+        """
+        self.start = timezone.now().replace(minute=0, second=0, microsecond=0) - timezone.timedelta(hours=1)
+        buffer = MeasurementBuffer(1000, 60)
+        for n in range(120):
+            buffer.add(TempData(instrumentId='IntsPrueba', parameterName='temp', user='user', content=str(n),
+                                numericContent=float(n), queryDate=self.start + timezone.timedelta(seconds=n)))
+        buffer.flush()
+        self.url = '/v1/instruments/IntsPrueba/measurements/'
+
+    def get(self, **params):
+        params.setdefault('start', self.start.isoformat())
+        params.setdefault('end', (self.start + timezone.timedelta(hours=1)).isoformat())
+        return self.client.get(self.url, params, HTTP_API_KEY=settings.API_KEY)
+
+    def test_cursor_pagination(self):
+        """
+        The pages follow the cursor until the last one
+        """
+        ids = []
+        response = self.get(limit=50).data
+        while True:
+            ids.extend(measurement['id'] for measurement in response['measurements'])
+            if response['next'] is None:
+                break
+            response = self.get(limit=50, cursor=response['next']).data
+        self.assertEqual(ids, list(TempData.objects.order_by('id').values_list('id', flat=True)))
+
+    def test_bucket_downsampling(self):
+        """
+        Buckets shorter than a minute are computed from the measurements, longer ones from the rollups
+        """
+        response = self.get(end=(self.start + timezone.timedelta(seconds=120)).isoformat(), parameter='temp',
+                            points=4).data
+        self.assertEqual(response['source'], 'raw')
+        self.assertEqual([(m['count'], m['min'], m['max'], m['mean']) for m in response['measurements']],
+                         [(30, 0.0, 29.0, 14.5), (30, 30.0, 59.0, 44.5), (30, 60.0, 89.0, 74.5),
+                          (30, 90.0, 119.0, 104.5)])
+
+        response = self.get(parameter='temp', points=60).data
+        self.assertEqual(response['source'], 'minute')
+        self.assertEqual([(m['count'], m['min'], m['max']) for m in response['measurements']],
+                         [(60, 0.0, 59.0), (60, 60.0, 119.0)])
+
+    def test_lttb_downsampling(self):
+        """
+        LTTB keeps the first and last points and the peaks
+        """
+        points = [(n, 10.0 if n == 50 else 0.0) for n in range(100)]
+        sampled = lttb(points, 10)
+        self.assertEqual(len(sampled), 10)
+        self.assertEqual((sampled[0], sampled[-1]), (points[0], points[-1]))
+        self.assertIn((50, 10.0), sampled)
+
+        response = self.get(end=(self.start + timezone.timedelta(seconds=120)).isoformat(), parameter='temp',
+                            points=10, method='lttb').data
+        self.assertEqual(len(response['measurements']), 10)
+
+    def test_lttb_long_series(self):
+        """
+        A series longer than MEASUREMENTS_MAX_LTTB_INPUT is reduced to bucket means before LTTB
+        """
+        end = self.start + timezone.timedelta(seconds=120)
+        with self.settings(MEASUREMENTS_MAX_LTTB_INPUT=30):
+            response = self.get(end=end.isoformat(), parameter='temp', points=10, method='lttb').data
+        self.assertEqual(len(response['measurements']), 10)
+        self.assertEqual(response['measurements'][0]['value'], 1.5)  # mean of the first 4 seconds
+        self.assertEqual(response['measurements'][-1]['value'], 117.5)
+
+    def test_wrong_parameters(self):
+        self.assertEqual(self.get(points=10).status_code, 400)
+        self.assertEqual(self.get(start='yesterday').status_code, 400)
+
+    def test_date_parameters(self):
+        """
+        start and end accept dates (midnight) as well as datetimes, the same as the export_measurements command
+        """
+        day = self.start.date().isoformat()
+        self.assertEqual(parse_date(day), parse_date(day + 'T00:00:00'))
+        self.assertEqual(export_measurements.parse(day), parse_date(day))
+        self.assertRaises(ValueError, parse_date, 'yesterday')
+        self.assertEqual(self.get(start=day).status_code, 200)
+
+
+class D_MeasurementsExportTestCase(django.test.TestCase):
+    """
+    Test batteries for the streaming export of the measurements
+    """
+    def setUp(self):
+        """
+        Populate the data base with temps data of two instruments
+        """
+        for n in range(25):
+            TempData.objects.create(instrumentId='IntsPrueba' if n % 5 else 'OtherInst', parameterName='param',
+                                    user='user', content='lectura, "ok"', numericContent=n if n % 2 else None,
+                                    queryDate=timezone.now())
+
+    def test_export_formats(self):
+        """
+        The export walks all the measurements filtered, in blocks, as NDJSON or CSV
+        """
+        temps_data = export.filter_measurements(instrumentId='IntsPrueba')
+        with self.settings(EXPORT_BLOCK_SIZE=7):
+            lines = b''.join(export.iter_export(temps_data, 'ndjson')).decode('utf-8').splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines],
+                         list(temps_data.order_by('id').values_list('id', flat=True)))
+        self.assertEqual(json.loads(lines[0])['content'], 'lectura, "ok"')
+
+        csv_data = gzip.decompress(b''.join(export.iter_export(temps_data, 'csv', compress=True))).decode('utf-8')
+        self.assertEqual(len(csv_data.splitlines()), 21)
+        self.assertTrue(csv_data.startswith('id,instrumentId,parameterName'))
+
+    def test_export_endpoint(self):
+        """
+        The endpoint streams the export compressed when the client accepts gzip
+        """
+        response = self.client.get('/v1/measurements/export/', {'output': 'csv', 'instrumentId': 'OtherInst'},
+                                   HTTP_API_KEY=settings.API_KEY, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        data = gzip.decompress(b''.join(response.streaming_content)).decode('utf-8')
+        self.assertEqual(len(data.splitlines()), 6)
+
+        response = self.client.get('/v1/measurements/export/', {'output': 'csv', 'instrumentId': 'OtherInst'},
+                                   HTTP_API_KEY=settings.API_KEY, HTTP_ACCEPT_ENCODING='gzip;q=0, identity')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 6)
+
+    def test_accepts_gzip(self):
+        self.assertTrue(measurement_views.accepts_gzip('gzip'))
+        self.assertTrue(measurement_views.accepts_gzip('deflate, GZIP;q=0.5'))
+        self.assertTrue(measurement_views.accepts_gzip('*'))
+        self.assertFalse(measurement_views.accepts_gzip(''))
+        self.assertFalse(measurement_views.accepts_gzip('gzip;q=0'))
+        self.assertFalse(measurement_views.accepts_gzip('x-gzip'))
+        self.assertFalse(measurement_views.accepts_gzip('*;q=0.5, gzip; q=0.0'))
+
+
+class E_ConvertToolsTestCase(django.test.SimpleTestCase):
+    """
+    Test batteries for the hex conversions of the raw commands
+    """
+    def test_to_str(self):
+        self.assertEqual(ct.to_str(b'\x00\x01\x0a\xaf\xff'), '00010aafff')
+        self.assertEqual(ct.to_str(bytearray(b'\x05')), '05')
+        self.assertEqual(ct.to_str(b''), '')
+
+    def test_simple_hex_to_formal_hex(self):
+        self.assertEqual(ct.simple_hex_to_formal_hex('AA2F510003'), r'\xAA\x2F\x51\x00\x03')
+        self.assertEqual(ct.simple_hex_to_formal_hex('abc'), r'\xab\xc')
+        self.assertEqual(ct.simple_hex_to_formal_hex('xyz'), '')
+        self.assertEqual(ct.simple_hex_to_formal_hex(''), '')
+
+
+class F_BinaryValuesTestCase(django.test.SimpleTestCase):
+    """
+    Test batteries for the IEEE 488.2 binary blocks of query_binary_values
+    """
+    def test_binary_block_header(self):
+        self.assertEqual(ct.binary_block_header(b'#213abcdefghijklm\n'), (4, 13))
+        self.assertEqual(ct.binary_block_header(b'CURV #0abc\n'), (7, None))
+        self.assertRaises(ValueError, ct.binary_block_header, b'abc')
+        self.assertRaises(ValueError, ct.binary_block_header, b'#3 1')
+
+    @unittest.skipIf(ct.numpy is None, 'NumPy is not installed')
+    def test_query_binary_values(self):
+        """
+        A block received in several reads is returned as an array of the given type
+        """
+        data = struct.pack('>4h', 1, -2, 3, 1000)
+        block = b'#18' + data + b'\n'
+        shared = Mock()
+        shared.resource.read_raw.side_effect = [block[:5], block[5:]]
+        mng = manager.QueryBinaryValuesManager('instr', shared=shared)
+        response = mng.execute_command({'message': 'CURV?', 'dtype': 'i2', 'big_endian': True})
+        self.assertEqual(response.response_data['state'], 'success')
+        self.assertEqual(response.response_data['dtype'], '>i2')
+        self.assertEqual(response.response_data['count'], 4)
+        self.assertEqual(ct.binary_block_to_array(data, 'i2', True).tolist(), [1, -2, 3, 1000])
+        self.assertEqual(response.response_data['result'], base64.b64encode(data).decode('ascii'))
+        shared.resource.write.assert_called_once_with('CURV?')
+
+
+class G_RawStreamTestCase(django.test.SimpleTestCase):
+    """
+    Test batteries for the streaming of read_raw and query_raw
+    """
+    def setUp(self):
+        self.shared = Mock()
+        self.shared.resource.visalib.read.side_effect = [
+            (b'\x00\x01', manager.v_cons.StatusCode.success_max_count_read),
+            (b'\x02\xff', manager.v_cons.StatusCode.success_max_count_read),
+            (b'\n', manager.v_cons.StatusCode.success)]
+
+    def test_stream_chunks(self):
+        """
+        The response is read in chunks until the instrument has nothing else to send, then the instrument is unlocked
+        """
+        mng = manager.StreamRawCommandManager('instr', shared=self.shared)
+        response = mng.execute_command({'message': '0001', 'chunk_size': 2, 'lock': 'lock'})
+        self.assertEqual(response.response_data['state'], 'success')
+        self.shared.resource.write_raw.assert_called_once_with(ct.to_byte('0001'))
+        self.assertEqual(list(response.stream), [b'\x00\x01', b'\x02\xff', b'\n'])
+        self.shared.resource.visalib.read.assert_called_with(self.shared.resource.session, 2)
+        response.stream.close()
+        self.shared.resource.unlock.assert_called_once_with()
+
+    def test_stream_hex(self):
+        mng = manager.StreamRawCommandManager('instr', shared=self.shared)
+        response = mng.execute_command({'output': 'hex'})
+        self.assertEqual(b''.join(response.stream), b'0001' + b'02ff' + b'0a')
+        self.assertFalse(self.shared.resource.write_raw.called)
+
+    def test_stream_closed_before_reading(self):
+        """
+        The instrument is unlocked even if the client goes away before the first chunk
+        """
+        mng = manager.StreamRawCommandManager('instr', shared=self.shared)
+        response = mng.execute_command({'lock': 'lock'})
+        response.stream.close()
+        self.shared.resource.unlock.assert_called_once_with()
+        self.assertFalse(self.shared.resource.visalib.read.called)
+
+
+class H_CommandJobsTestCase(django.test.TestCase):
+    """
+    Test batteries for the asynchronous execution of the direct commands
+    """
+    url = '/v1/instruments/IntsPrueba/commands/query/'
+
+    @patch('remoteinstrapp.tasks.execute_job')
+    def test_submit_and_poll(self, execute_job):
+        """
+        The command is sent to the workers and the client receives the job, then its response once it is executed
+        """
+        response = self.client.post(self.url + '?async=true', json.dumps({'message': '*IDN?'}),
+                                    content_type='application/json', HTTP_API_KEY=settings.API_KEY)
+        self.assertEqual(response.status_code, 202)
+        jobId = response.data['jobId']
+        self.assertEqual(response.data['state'], 'pending')
+        self.assertTrue(response['Location'].endswith('/v1/jobs/{0}/'.format(jobId)))
+        execute_job.apply_async.assert_called_once_with((jobId,), queue=settings.COMMAND_JOBS_QUEUE)
+
+        with patch('remoteinstrapp.app_management.jobs.run_command',
+                   return_value=({'state': 'success', 'result': 'INSTR,1'}, 200, None)) as run_command:
+            self.assertTrue(jobs.run_job(jobId))
+            self.assertFalse(jobs.run_job(jobId))  # only once
+        run_command.assert_called_once_with('IntsPrueba', 'QueryInstrumentManager', {'message': '*IDN?'})
+
+        response = self.client.get('/v1/jobs/{0}/'.format(jobId), HTTP_API_KEY=settings.API_KEY)
+        self.assertEqual(response.data['state'], 'done')
+        self.assertEqual(response.data['httpStatus'], 200)
+        self.assertEqual(response.data['response'], {'state': 'success', 'result': 'INSTR,1'})
+
+    def test_long_polling(self):
+        """
+        A pending job is returned once the time to wait has elapsed
+        """
+        job = Job.objects.create(jobId='abc', instrumentId='IntsPrueba', managerType='QueryInstrumentManager',
+                                 data='{}')
+        started = timezone.now()
+        self.assertEqual(jobs.wait_job(job.jobId, 0.3, 0.1).state, 'pending')
+        self.assertGreaterEqual((timezone.now() - started).total_seconds(), 0.3)
+        response = self.client.get('/v1/jobs/unknown/', HTTP_API_KEY=settings.API_KEY)
+        self.assertEqual(response.status_code, 404)
+
+    def test_stale_jobs(self):
+        """
+        The jobs left running (or pending) by a dead worker are marked as failed, the recent ones are not touched
+        """
+        old = timezone.now() - timezone.timedelta(hours=1)
+        for jobId, state in (('running', 'running'), ('pending', 'pending'), ('recent', 'running')):
+            Job.objects.create(jobId=jobId, instrumentId='IntsPrueba', managerType='QueryInstrumentManager',
+                               data='{}', state=state, started=timezone.now() if jobId == 'recent' else old)
+        Job.objects.exclude(jobId='recent').update(created=old)
+        self.assertEqual(jobs.fail_stale_jobs(600), 2)
+        job = Job.objects.get(jobId='running')
+        self.assertEqual((job.state, job.httpStatus), ('done', 500))
+        self.assertEqual(json.loads(job.result)['state'], 'unknownError')
+        self.assertEqual(Job.objects.get(jobId='pending').state, 'done')
+        self.assertEqual(Job.objects.get(jobId='recent').state, 'running')
+
+
+class I_CommandBatchTestCase(django.test.SimpleTestCase):
+    """
+    Test batteries for the batches of direct commands
+    """
+    def setUp(self):
+        self.base = Mock()
+        self.base.instrument.instrumentId = 'IntsPrueba'
+        self.base.resource.query.return_value = '1.25'
+        patcher = patch('remoteinstrapp.app_management.runner.open_manager', return_value=(self.base, None, '', ''))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_single_lock(self):
+        """
+        All the commands run on the same session, locked once, and return their results in order
+        """
+        commands = [{'method': 'write', 'message': 'CONF:VOLT', 'lock': 'lock'},
+                    {'method': 'query', 'message': 'MEAS:VOLT?'}]
+        response, http_state = runner.run_batch('IntsPrueba', commands, 'lock_excl')
+        self.assertEqual(response['state'], 'success')
+        self.assertEqual([result['state'] for result in response['results']], ['success', 'success'])
+        self.assertEqual(response['results'][1]['result'], '1.25')
+        self.base.resource.write.assert_called_once_with('CONF:VOLT', termination=None, encoding=None)
+        self.base.resource.query.assert_called_once_with('MEAS:VOLT?', delay=0)
+        self.base.resource.lock_excl.assert_called_once_with()
+        self.base.resource.unlock.assert_called_once_with()
+        self.assertFalse(self.base.resource.lock.called)
+        self.base.close.assert_called_once_with(discard=False)
+
+    def test_stop_on_error(self):
+        self.base.resource.query.side_effect = IOError('timeout')
+        commands = [{'method': 'query', 'message': 'MEAS:VOLT?'}, {'method': 'write', 'message': 'CONF:VOLT'}]
+        response, http_state = runner.run_batch('IntsPrueba', commands)
+        self.assertEqual(response['state'], 'error')
+        self.assertEqual([result['state'] for result in response['results']], ['queryError', 'skipped'])
+        self.assertFalse(self.base.resource.write.called)
+        self.base.close.assert_called_once_with(discard=True)
+
+    def test_validate_batch(self):
+        self.assertIsNone(runner.validate_batch([{'method': 'read'}]))
+        self.assertIsNotNone(runner.validate_batch([]))
+        self.assertIsNotNone(runner.validate_batch([{'method': 'read_raw_stream'}]))
+
+
+class J_FanoutTestCase(django.test.SimpleTestCase):
+    """
+    Test batteries for the same command executed on several instruments
+    """
+    @patch('remoteinstrapp.app_management.runner.run_command')
+    def test_concurrent_lanes(self, run_command):
+        """
+        The instruments are queried concurrently, once each one
+        """
+        barrier = threading.Barrier(3, timeout=10)  # only passed if the three lanes are running at the same time
+
+        def fake_command(instrumentId, manager_type, data):
+            barrier.wait()
+            return {'state': 'success', 'result': instrumentId}, 200, None
+
+        run_command.side_effect = fake_command
+        response = runner.run_fanout(['i1', 'i2', 'i3', 'i1'], 'query', {'message': 'MEAS:VOLT?'}, 30)
+        self.assertEqual(response['state'], 'success')
+        self.assertEqual([result['instrumentId'] for result in response['results']], ['i1', 'i2', 'i3'])
+        self.assertTrue(all(result['latency'] >= 0 for result in response['results']))
+        self.assertEqual(run_command.call_count, 3)
+        run_command.assert_any_call('i2', 'QueryInstrumentManager', {'message': 'MEAS:VOLT?'})
+
+    @patch('remoteinstrapp.app_management.runner.run_command')
+    def test_deadline(self, run_command):
+        """
+        The instruments that have not answered before the deadline are returned without result, and the lanes
+        abandoned do not hold the next requests
+        """
+        release = threading.Event()
+
+        def fake_command(instrumentId, manager_type, data):
+            if instrumentId == 'slow':
+                release.wait(30)
+            return {'state': 'success', 'result': instrumentId}, 200, None
+
+        run_command.side_effect = fake_command
+        try:
+            # the deadline expires as soon as the first instrument has answered
+            with patch('remoteinstrapp.app_management.runner.wait',
+                       side_effect=lambda futures, timeout: wait(futures, return_when=FIRST_COMPLETED)) as fanout_wait:
+                response = runner.run_fanout(['fast', 'slow'], 'query', {'message': 'MEAS:VOLT?'}, 0.5)
+            self.assertEqual(fanout_wait.call_args[1]['timeout'], 0.5)
+            self.assertEqual(response['state'], 'partial')
+            self.assertEqual([result['state'] for result in response['results']], ['success', 'deadlineExceeded'])
+
+            response = runner.run_fanout(['other'], 'query', {'message': 'MEAS:VOLT?'}, 30)
+            self.assertEqual(response['state'], 'success')
+            self.assertFalse(release.is_set())
+        finally:
+            release.set()
+
+    @patch('remoteinstrapp.app_management.runner.run_command')
+    def test_lanes_bound(self, run_command):
+        """
+        A query is rejected while the lanes running (abandoned ones included) would exceed FANOUT_MAX_LANES
+        """
+        release = threading.Event()
+
+        def fake_command(instrumentId, manager_type, data):
+            release.wait(30)
+            return {'state': 'success', 'result': instrumentId}, 200, None
+
+        run_command.side_effect = fake_command
+        with self.settings(FANOUT_MAX_LANES=2):
+            try:
+                response = runner.run_fanout(['i1', 'i2'], 'query', {'message': 'MEAS:VOLT?'}, 0)
+                self.assertEqual(response['state'], 'error')
+                self.assertIsNone(runner.run_fanout(['i3'], 'query', {'message': 'MEAS:VOLT?'}, 0))
+            finally:
+                release.set()
+            for _ in range(3000):  # the abandoned lanes give their reservation back when they finish
+                if runner.reserve_lanes(2):
+                    break
+                threading.Event().wait(0.01)
+            else:
+                self.fail('the lanes have not been released')
+            runner.release_lanes(2)
+            self.assertIsNotNone(runner.run_fanout(['i1', 'i2'], 'query', {'message': 'MEAS:VOLT?'}, 30))
+
+    def test_wrong_instruments(self):
+        """
+        The instrumentIds must be non empty strings
+        """
+        for instrumentIds in ([{'a': 1}], ['i1', ''], [1], 'i1'):
+            response = self.client.post('/v1/commands/fanout/', json.dumps({'instrumentIds': instrumentIds,
+                                                                            'method': 'query', 'message': '*IDN?'}),
+                                        content_type='application/json', HTTP_API_KEY=settings.API_KEY)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.data['state'], 'wrongFanout')
@@ -5,8 +5,19 @@ manager that wraps PyVisa objects.
 __author__ = 'macastro'
 
 
+import binascii
 import re
 
+# NumPy is only needed for the binary values (see binary_block_to_array)
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# checking of hexadecimal notation. Only the first character decides if it matches, so there is no need to scan the
+# whole string
+HEX_PATTERN = re.compile(r'[0-9A-Fa-f]')
+
 
 def simple_hex_to_formal_hex(hex_simple_str):
     """
@@ -15,42 +26,99 @@ def simple_hex_to_formal_hex(hex_simple_str):
     :param hex_simple_str: simple hex format
     :return: str: log hex format \\x
     """
-    pat = re.compile(r'([0-9A-Fa-f])+')  # checking of hexadecimal notation
-    if not pat.match(hex_simple_str) and len(hex_simple_str) % 2 != 0:  # if it is odd ... returns ""
+    if not HEX_PATTERN.match(hex_simple_str) and len(hex_simple_str) % 2 != 0:  # if it is odd ... returns ""
         return ''
-    hex_str = ''
-    i = 0
-    while i < len(hex_simple_str): # we build the formal hexadecimal string
-        hex_str += r'\x' + hex_simple_str[i:i + 2]
-        i += 2
+    try:
+        source = hex_simple_str.encode('ascii')
+    except UnicodeEncodeError:  # it can not be interleaved byte by byte, we build it with a single join
+        return ''.join([r'\x' + hex_simple_str[i:i + 2] for i in range(0, len(hex_simple_str), 2)])
 
-    return hex_str
+    # we build the formal hexadecimal string interleaving '\', 'x' and the two digits of every byte
+    pairs, odd = divmod(len(source), 2)
+    formal = bytearray(4 * pairs)
+    formal[0::4] = b'\\' * pairs
+    formal[1::4] = b'x' * pairs
+    formal[2::4] = source[0:2 * pairs:2]
+    formal[3::4] = source[1:2 * pairs:2]
+    if odd:
+        formal += b'\\x' + source[-1:]
+    return formal.decode('ascii')
 
 
 def to_byte(hex_simple_str):
     '''
     From string to byte. Notice that this must have hexadecimal values.
-    :param hex_simple_str: string with hexadecimal values
+    :param hex_simple_str: string with hexadecimal values. A byte object is returned as it is (already converted)
     :return: python byte object
     '''
+    if isinstance(hex_simple_str, bytes):
+        return hex_simple_str
     return bytes.fromhex(hex_simple_str)
 
 
+def parse_number(content, parser):
+    '''
+    Numeric value of the result of a command.
+    :param content: the result, text or a string with hexadecimal values (see to_str)
+    :param parser: 'text' (no numeric value), 'float', 'int', 'hex_be' or 'hex_le' (unsigned integer from the hex
+    string in big or little endian)
+    :return: the number (float or int) or None if the parser is 'text'. ValueError if the content can not be parsed
+    '''
+    if not parser or parser == 'text':
+        return None
+    content = content.strip()
+    if parser == 'float':
+        return float(content)
+    if parser == 'int':
+        return int(content)
+    if parser == 'hex_be':
+        return int(content, 16)
+    if parser == 'hex_le':
+        return int.from_bytes(to_byte(content), 'little')
+    raise ValueError('Parser not supported: {0}'.format(parser))
+
+
+def binary_block_header(data):
+    '''
+    Parse the header of an IEEE 488.2 binary block: '#<n><length><data>' (definite length, n digits of length) or
+    '#0<data>' (indefinite length, until the termination).
+    :param data: bytes, bytearray or memoryview with the beginning of the response of the instrument
+    :return: a tuple (offset of the data, length of the data or None if it is indefinite). ValueError if the header is
+    wrong or it has not been received completely
+    '''
+    start = bytes(data[:64]).find(b'#')  # some instruments send a prefix (e.g. the echo of the command)
+    if start < 0 or len(data) < start + 2:
+        raise ValueError('There is not a binary block header in the response')
+    digits = data[start + 1] - ord('0')
+    if not 0 <= digits <= 9:
+        raise ValueError('Wrong binary block header')
+    if digits == 0:
+        return start + 2, None
+    length = bytes(data[start + 2:start + 2 + digits])
+    if len(length) < digits or not length.isdigit():
+        raise ValueError('Wrong binary block header')
+    return start + 2 + digits, int(length)
+
+
+def binary_block_to_array(data, dtype='f4', big_endian=False):
+    '''
+    Interpret the data of a binary block as an array without copying it.
+    :param data: bytes, bytearray or memoryview with the data of the block (without header)
+    :param dtype: NumPy type of the values ('f4', 'f8', 'i2', 'u1'...)
+    :param big_endian: byte order of the values
+    :return: a numpy.ndarray. ImportError if NumPy is not installed, ValueError/TypeError if the data or the type are
+    wrong
+    '''
+    if numpy is None:
+        raise ImportError('NumPy is not installed, it is needed for binary values')
+    return numpy.frombuffer(data, dtype=numpy.dtype(dtype).newbyteorder('>' if big_endian else '<'))
+
+
 def to_str(byte_obj):
     '''
     Try to convert a byte object with the format b' \0xMN\0xPQ...' to a string to hex format as following type 'MNPQ...'
     where the length of it, is an even number.
-    :param byte_obj: python byte object
+    :param byte_obj: python byte object (or any object with the buffer interface: bytearray, memoryview...)
     :return: string with hexadecimal values
     '''
-    str_decodes = byte_obj.decode('latin-1') # we use latin-1 because it gives us more capacity
-    # for greater hexadecimal numbers
-    hex_str = ''
-    for ch in str_decodes:
-        hex_str += hex(ord(ch))
-
-    # Now we build the final string using between a list that has been filled with 0 in case of a
-    # digit after 0X comes alone. For instance 0x1 would be 0x01 and 0xa3 would remain 0xa3
-
-    return ''.join(['0' + el if len(el) == 1 else el for el in hex_str.split('0x')][1:])
-
+    return binascii.hexlify(byte_obj).decode('ascii')
@@ -0,0 +1,30 @@
+"""
+Dates of the parameters of the measurements API and of the export_measurements command, so both accept the same
+formats.
+"""
+__author__ = 'macastro'
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date as parse_day, parse_datetime
+
+
+def parse_date(value, default=None):
+    """
+    :param value: ISO 8601 datetime or date (midnight of that day) or None
+    :param default: datetime returned if value is None
+    :return: the datetime, aware or naive as the project (USE_TZ). ValueError if it is wrong
+    """
+    if not value:
+        return default
+    date = parse_datetime(value)
+    if date is None:
+        day = parse_day(value)
+        if day is None:
+            raise ValueError('Wrong datetime: {0}'.format(value))
+        date = parse_datetime(day.isoformat() + 'T00:00:00')
+    if settings.USE_TZ and timezone.is_naive(date):
+        date = timezone.make_aware(date, timezone.get_current_timezone())
+    elif not settings.USE_TZ and timezone.is_aware(date):
+        date = timezone.make_naive(date, timezone.get_current_timezone())
+    return date
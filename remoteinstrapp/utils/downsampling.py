@@ -0,0 +1,71 @@
+"""
+Downsampling of time series for the measurements API. The points are tuples whose first element is the time in seconds
+(relative to any origin) and whose second one is the value.
+"""
+__author__ = 'macastro'
+
+
+def lttb(points, threshold):
+    '''
+    Largest-Triangle-Three-Buckets. It keeps the shape of the series (peaks included) with threshold points: the first
+    and the last points are kept and from every bucket between them the point that forms the largest triangle with
+    the point chosen in the previous bucket and the average of the next bucket.
+    :param points: list of (time, value) ordered by time
+    :param threshold: number of points wanted
+    :return: list of points, a subset of points
+    '''
+    length = len(points)
+    if threshold >= length or threshold < 3:
+        return list(points)
+
+    sampled = [points[0]]
+    every = (length - 2) / float(threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # average of the next bucket
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, length)
+        avg_length = avg_end - avg_start
+        avg_x = sum(point[0] for point in points[avg_start:avg_end]) / avg_length
+        avg_y = sum(point[1] for point in points[avg_start:avg_end]) / avg_length
+
+        # point of this bucket with the largest triangle
+        ax, ay = points[a][0], points[a][1]
+        max_area = -1
+        for j in range(int(i * every) + 1, int((i + 1) * every) + 1):
+            area = abs((ax - avg_x) * (points[j][1] - ay) - (ax - points[j][0]) * (avg_y - ay))
+            if area > max_area:
+                max_area = area
+                a_candidate = j
+        sampled.append(points[a_candidate])
+        a = a_candidate
+
+    sampled.append(points[-1])
+    return sampled
+
+
+def bucket_aggregate(rows, width, buckets):
+    '''
+    Aggregate a series in buckets of the same width. The rows can be single values or partial aggregates (rollups),
+    so both are merged the same way.
+    :param rows: iterable of (time, count, total, minimum, maximum), time from the start of the first bucket. A single
+    value v is (time, 1, v, v, v)
+    :param width: width of the buckets in seconds
+    :param buckets: number of buckets, the rows out of them are ignored
+    :return: list of (index of the bucket, count, mean, minimum, maximum) of the buckets with data, ordered
+    '''
+    result = {}
+    for time, count, total, minimum, maximum in rows:
+        index = int(time // width)
+        if index < 0 or index >= buckets or not count:
+            continue
+        current = result.get(index)
+        if current is None:
+            result[index] = [count, total, minimum, maximum]
+        else:
+            current[0] += count
+            current[1] += total
+            current[2] = min(current[2], minimum)
+            current[3] = max(current[3], maximum)
+    return [(index, count, total / count, minimum, maximum)
+            for index, (count, total, minimum, maximum) in sorted(result.items())]
@@ -3,7 +3,9 @@ __author__ = 'macastro'
 import json
 import logging
 
-from django.core.exceptions import ObjectDoesNotExist
+from django.conf import settings
+from django.core.urlresolvers import reverse
+from django.http import HttpResponse, StreamingHttpResponse
 from rest_framework import viewsets
 
 from rest_framework.response import Response
@@ -12,8 +14,9 @@ from rest_framework import status as st
 from remoteinstrapp.permission import SimpleAuthentication, GivingPermissions
 from remoteinstrapp.models import Instrument
 from remoteinstrapp.serializers import  DirectCommandSerializer
-from remoteinstrapp.app_management import manager
-from remoteinstrapp.exceptions import OpenInstrumentError, NoBackendError
+from remoteinstrapp.app_management import jobs
+from remoteinstrapp.app_management.executor import callable_manager_map
+from remoteinstrapp.app_management.runner import open_manager, run_command, validate_batch, run_batch, run_fanout
 
 
 # Get an instance of a logger
@@ -52,74 +55,35 @@ def perform_method(request,instrumentId,manager_type):
     :param manager_type:
     :return:
     """
+    if is_async(request): # the command is executed by a job, the client polls /v1/jobs/<jobId>/
+        job = jobs.submit_job(instrumentId, manager_type, request_data(request))
+        location = reverse('job-detail', kwargs={'jobId': job.jobId})
+        response = Response(jobs.job_to_dict(job, location), status=st.HTTP_202_ACCEPTED)
+        response['Location'] = request.build_absolute_uri(location)
+        return response
+
+    rest_response, http_state, binary = run_command(instrumentId, manager_type, request.data)
+    if binary is not None:
+        binary_response = HttpResponse(binary.tobytes(), content_type='application/octet-stream')
+        binary_response['X-Dtype'] = rest_response['dtype']
+        binary_response['X-Count'] = rest_response['count']
+        return binary_response
 
-    result = ''
-    state = ''
-    rest_response = {}
-    http_state = None
-    try: # to call the proper instrument manager
-        mng = {
-                "WriteRawCommandManager":manager.WriteRawCommandManager,
-                "QueryInstrumentManager":manager.QueryInstrumentManager,
-                "QueryRawInstrumentManager":manager.QueryRawInstrumentManager,
-                "ReadRawCommandManager":manager.ReadRawCommandManager,
-                "ReadCommandManager":manager.ReadCommandManager,
-                "WriteCommandManager":manager.WriteCommandManager,
-                "GetVisaAttributeCommandManager":manager.GetVisaAttributeCommandManager,
-               }[manager_type](instrumentId)
-
-    except ImportError as error: # if pyvisa is not installed
-        http_state = st.HTTP_500_INTERNAL_SERVER_ERROR
-        state = 'pyVisaNotInstalled'
-        result = str(error)
-    except ObjectDoesNotExist as error:
-        http_state = st.HTTP_404_NOT_FOUND
-        state='instrumentNotExists'
-        result = str(error)
-    except ValueError as error: # raise when the user set a bad backend, not in the oficial list of backends
-        http_state = st.HTTP_400_BAD_REQUEST
-        state='wrongBackendConfigured'
-        result = str(error)
-    except NoBackendError as error: # The backend in data is not installed in the computer
-        http_state = st.HTTP_500_INTERNAL_SERVER_ERROR
-        state='noBackendError'
-        result = str(error)
-    except OpenInstrumentError as error: # The instrument in data is not connected to the computer
-        http_state = st.HTTP_500_INTERNAL_SERVER_ERROR
-        state='openInstrumentError'
-        result = str(error)
-    except OSError as error: #if the backend is not installed
-        http_state = st.HTTP_500_INTERNAL_SERVER_ERROR
-        state ='oserror'
-        result = str(error)
-    except AttributeError as error: # due to visaParameter_string or visaParameter_numeric assignement
-            http_state = st.HTTP_500_INTERNAL_SERVER_ERROR
-            state = 'pyVisaParametersError'
-            result = str(error)
-    except Exception as error: # another exception that we do not know previously
-        state = 'unknownError'
-        http_state = st.HTTP_500_INTERNAL_SERVER_ERROR
-        result = str(error)
-
-    #we execute the command
-    if not http_state:
-        data = request.data
-        try:
-            response = mng.execute_command(data)
-            http_state = response.status
-            state = response.response_data['state']
-            result= response.response_data['result']
+    return Response(rest_response, status=http_state)
 
 
-        except AttributeError as error: # due to visaAttributes_string or visaAttributes_numeric assignement
-            http_state = st.HTTP_400_BAD_REQUEST
-            state = 'VisaAttributesError'
-            result = str(error)
+def is_async(request):
+    """
+    :return: True if the client asks to execute the command as a job (?async=true)
+    """
+    return request.query_params.get('async', '').lower() in ('1', 'true', 'yes')
 
-    rest_response['state'] = state
-    rest_response['result'] = result
 
-    return Response(rest_response, status=http_state)
+def request_data(request):
+    """
+    :return: the data of the request as a plain dict (json or form)
+    """
+    return request.data.dict() if hasattr(request.data, 'dict') else dict(request.data)
 
 
 class CommandWriteRawViewSet(viewsets.ModelViewSet):
@@ -193,6 +157,131 @@ class CommandQueryRawViewSet(viewsets.ModelViewSet):
         return perform_method(request,kwargs['instrumentId'],'QueryRawInstrumentManager')
 
 
+class CommandQueryBinaryValuesViewSet(viewsets.ModelViewSet):
+    """
+    POST to execute query_binary_values
+    """
+    permission_classes=(GivingPermissions,)
+    authentication_classes = (SimpleAuthentication,)
+    serializer_class = DirectCommandSerializer
+
+    def perform_query_binary_values(self, request, *args, **kwargs):
+        return perform_method(request,kwargs['instrumentId'],'QueryBinaryValuesManager')
+
+
+def perform_stream(request, instrumentId, with_message):
+    """
+    Execute a raw read (read_raw or query_raw) streaming the response to the client while it is read from the
+    instrument (see manager.StreamRawCommandManager). The errors before the first chunk are returned as json like
+    in perform_method.
+    :param with_message: True for query_raw (the message is written first), False for read_raw
+    """
+    mng, http_state, state, result = open_manager(instrumentId, 'StreamRawCommandManager')
+    if mng is not None:
+        data = request.data.copy()
+        if not with_message:
+            data.pop('message', None)
+        try:
+            response = mng.execute_command(data)
+            if response.stream is not None:
+                as_hex = data.get('output', 'octet') == 'hex'
+                return StreamingHttpResponse(response.stream,
+                                             content_type='text/plain' if as_hex else 'application/octet-stream')
+            http_state = response.status
+            state = response.response_data['state']
+            result = response.response_data['result']
+        except AttributeError as error: # due to visaAttributes_string or visaAttributes_numeric assignement
+            http_state = st.HTTP_400_BAD_REQUEST
+            state = 'VisaAttributesError'
+            result = str(error)
+            mng.close()
+        except Exception:
+            mng.close()
+            raise
+
+    return Response({'state': state, 'result': result}, status=http_state)
+
+
+class CommandReadRawStreamViewSet(viewsets.ModelViewSet):
+    """
+    POST to execute read_raw streaming the response
+    """
+    permission_classes=(GivingPermissions,)
+    authentication_classes = (SimpleAuthentication,)
+    serializer_class = DirectCommandSerializer
+
+    def perform_read_raw_stream(self, request, *args, **kwargs):
+        return perform_stream(request, kwargs['instrumentId'], False)
+
+
+class CommandQueryRawStreamViewSet(viewsets.ModelViewSet):
+    """
+    POST to execute query_raw streaming the response
+    """
+    permission_classes=(GivingPermissions,)
+    authentication_classes = (SimpleAuthentication,)
+    serializer_class = DirectCommandSerializer
+
+    def perform_query_raw_stream(self, request, *args, **kwargs):
+        return perform_stream(request, kwargs['instrumentId'], True)
+
+
+class CommandBatchViewSet(viewsets.ModelViewSet):
+    """
+    POST to execute several commands in order on a single session of the instrument. The body is
+    {"commands": [{"method": "write", "message": ...}, ...], "lock": "lock", "stop_on_error": true}, every command with
+    the parameters of its own endpoint. The instrument is locked once for the whole batch.
+    """
+    permission_classes=(GivingPermissions,)
+    authentication_classes = (SimpleAuthentication,)
+    serializer_class = DirectCommandSerializer
+
+    def perform_batch(self, request, *args, **kwargs):
+        commands = request.data.get('commands')
+        error = validate_batch(commands)
+        if error:
+            return Response({'state': 'wrongBatch', 'result': error}, status=st.HTTP_400_BAD_REQUEST)
+        rest_response, http_state = run_batch(kwargs['instrumentId'], commands, request.data.get('lock', ""),
+                                              request.data.get('stop_on_error', True))
+        return Response(rest_response, status=http_state)
+
+
+class CommandFanoutViewSet(viewsets.ModelViewSet):
+    """
+    POST to execute the same command on several instruments concurrently. The body is
+    {"instrumentIds": [...], "method": "query", "message": "MEAS:VOLT?", "deadline": 5} plus the parameters of the
+    command endpoint. After the deadline (seconds, FANOUT_DEADLINE by default) the instruments that have not answered
+    are returned as 'deadlineExceeded'. 503 if the lanes running in the process would exceed FANOUT_MAX_LANES.
+    """
+    permission_classes=(GivingPermissions,)
+    authentication_classes = (SimpleAuthentication,)
+    serializer_class = DirectCommandSerializer
+
+    def perform_fanout(self, request, *args, **kwargs):
+        data = request_data(request)
+        instrumentIds = data.pop('instrumentIds', None)
+        method = data.pop('method', None)
+        try:
+            deadline = float(data.pop('deadline', getattr(settings, 'FANOUT_DEADLINE', 10)))
+            if not isinstance(instrumentIds, list) or not instrumentIds:
+                raise ValueError('instrumentIds must be a non empty list')
+            if not all(isinstance(instrumentId, str) and instrumentId for instrumentId in instrumentIds):
+                raise ValueError('instrumentIds must be non empty strings')
+            if len(instrumentIds) > getattr(settings, 'FANOUT_MAX_INSTRUMENTS', 100):
+                raise ValueError('too many instruments, the maximum is {0}'
+                                 .format(getattr(settings, 'FANOUT_MAX_INSTRUMENTS', 100)))
+            if method not in callable_manager_map:
+                raise ValueError('method not supported: {0}'.format(method))
+        except (TypeError, ValueError) as error:
+            return Response({'state': 'wrongFanout', 'result': str(error)}, status=st.HTTP_400_BAD_REQUEST)
+        deadline = min(max(deadline, 0), getattr(settings, 'FANOUT_MAX_DEADLINE', 60))
+        rest_response = run_fanout(instrumentIds, method, data, deadline)
+        if rest_response is None:
+            return Response({'state': 'fanoutBusy', 'result': 'Too many fan-out queries running, try again later'},
+                            status=st.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response(rest_response, status=st.HTTP_200_OK)
+
+
 class CommandGetVisaAttrViewSet(viewsets.ModelViewSet):
     """
     POST to execute get_visa_attribute
@@ -501,7 +501,8 @@ class ConfigInstrumentBackendsViewDetail(viewsets.ModelViewSet):
                 messg = util.get_debug_info(False)
                 matcher = re.finditer(r'\s+(.+):\s+Version:\s?([\S]+)',messg)
                 state = status.HTTP_200_OK
-                data = {'backends':[{"version":m.group(2),"backendId":m.group(1)} for m in matcher]}
+                data = {'backends':[{"version":m.group(2),"backendId":m.group(1)} for m in matcher],
+                        'loaded':manager.backends.get_load_stats()}
             except Exception:
                 data = {'detail':'Operation not available'}
                 state = status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -0,0 +1,39 @@
+"""
+State of the direct commands executed asynchronously (see remoteinstrapp.app_management.jobs).
+"""
+__author__ = 'macastro'
+
+import logging
+
+from django.conf import settings
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework import status
+
+from remoteinstrapp.permission import SimpleAuthentication, GivingPermissions
+from remoteinstrapp.models import Job
+from remoteinstrapp.app_management import jobs
+
+# Get an instance of a logger
+logger = logging.getLogger(__name__)
+
+
+class JobView(APIView):
+    """
+    A job, GET. With ?wait=<seconds> the response waits until the job is done or the seconds have elapsed (long
+    polling, up to COMMAND_JOBS_MAX_WAIT seconds). The response of the command is in 'response' once it is done.
+    """
+    permission_classes=(GivingPermissions,)
+    authentication_classes = (SimpleAuthentication,)
+
+    def get(self, request, jobId, format=None):
+        try:
+            wait = float(request.query_params.get('wait', 0))
+        except ValueError as err:
+            return Response({'error': str(err)}, status=status.HTTP_400_BAD_REQUEST)
+        wait = min(max(wait, 0), getattr(settings, 'COMMAND_JOBS_MAX_WAIT', 30))
+        try:
+            job = jobs.wait_job(jobId, wait)
+        except Job.DoesNotExist:
+            return Response({'detail': 'The job does not exist'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(jobs.job_to_dict(job))
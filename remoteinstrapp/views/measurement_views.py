@@ -0,0 +1,203 @@
+"""
+Read API of the measurements collected by the celery tasks (daemonsceleryapp). The measurements still stored in
+TempData are returned page by page, and the numeric series can be downsampled in the server, from the measurements
+themselves or from their minute/hour rollups when the buckets asked are coarse enough. The measurements can be
+exported too as a stream of NDJSON or CSV.
+"""
+__author__ = 'macastro'
+
+import logging
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework import status
+
+from remoteinstrapp.permission import SimpleAuthentication, GivingPermissions
+from remoteinstrapp.utils.dates import parse_date
+from remoteinstrapp.utils.downsampling import lttb, bucket_aggregate
+from daemonsceleryapp.models import TempData, MeasurementRollup
+from daemonsceleryapp.export import CONTENT_TYPES, filter_measurements, iter_export
+
+# Get an instance of a logger
+logger = logging.getLogger(__name__)
+
+# Rollups that can be used as source of a downsampled series, from the coarsest one
+ROLLUP_SECONDS = (('hour', 3600), ('minute', 60))
+
+
+class MeasurementsView(APIView):
+    """
+    Measurements of an instrument, GET. Query parameters:
+     - start, end: ISO 8601 datetimes (the last day by default)
+     - parameter: parameterName of the measurements (mandatory if points is given)
+     - cursor, limit: pagination of the measurements. cursor is the 'next' value of the previous page
+     - points: number of points wanted, the numeric series is downsampled
+     - method: downsampling method, 'bucket' (count, min, max and mean per bucket, by default) or 'lttb'
+    """
+    permission_classes=(GivingPermissions,)
+    authentication_classes = (SimpleAuthentication,)
+
+    def get(self, request, instrumentId, format=None):
+        params = request.query_params
+        try:
+            end = parse_date(params.get('end'), timezone.now())
+            start = parse_date(params.get('start'), end - timezone.timedelta(days=1))
+            if start >= end:
+                raise ValueError('start must be before end')
+            parameter = params.get('parameter')
+            if params.get('points'):
+                points = int(params['points'])
+                method = params.get('method', 'bucket')
+                if not 2 <= points <= getattr(settings, 'MEASUREMENTS_MAX_POINTS', 5000):
+                    raise ValueError('points out of range')
+                if method not in ('bucket', 'lttb'):
+                    raise ValueError('method not supported: {0}'.format(method))
+                if not parameter:
+                    raise ValueError('parameter is mandatory to downsample')
+                return Response(downsampled(instrumentId, parameter, start, end, points, method))
+
+            limit = int(params.get('limit', getattr(settings, 'MEASUREMENTS_PAGE_SIZE', 1000)))
+            limit = max(min(limit, getattr(settings, 'MEASUREMENTS_MAX_PAGE_SIZE', 10000)), 1)
+            cursor = int(params.get('cursor', 0))
+        except ValueError as err:
+            return Response({'error': str(err)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(page(instrumentId, parameter, start, end, cursor, limit))
+
+
+class MeasurementsExportView(APIView):
+    """
+    Export of the measurements, GET. The response is streamed while the measurements are read, and compressed with
+    gzip if the client accepts it. Query parameters:
+     - output: 'ndjson' (by default) or 'csv'
+     - instrumentId, parameter: filters of the measurements
+     - start, end: ISO 8601 datetimes (all the measurements by default)
+    """
+    permission_classes=(GivingPermissions,)
+    authentication_classes = (SimpleAuthentication,)
+
+    def get(self, request, format=None):
+        params = request.query_params
+        output_format = params.get('output', 'ndjson')
+        try:
+            if output_format not in CONTENT_TYPES:
+                raise ValueError('output not supported: {0}'.format(output_format))
+            temps_data = filter_measurements(params.get('instrumentId'), params.get('parameter'),
+                                             parse_date(params.get('start')), parse_date(params.get('end')))
+        except ValueError as err:
+            return Response({'error': str(err)}, status=status.HTTP_400_BAD_REQUEST)
+
+        compress = accepts_gzip(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        response = StreamingHttpResponse(iter_export(temps_data, output_format, compress),
+                                         content_type=CONTENT_TYPES[output_format])
+        response['Content-Disposition'] = 'attachment; filename="measurements.{0}"'.format(output_format)
+        if compress:
+            response['Content-Encoding'] = 'gzip'
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+
+def accepts_gzip(accept_encoding):
+    """
+    :param accept_encoding: value of the Accept-Encoding header, e.g. 'gzip;q=0.5, identity'
+    :return: True if the q-value of gzip (or of '*' if gzip is not given) is greater than 0
+    """
+    qvalues = {}
+    for coding in accept_encoding.split(','):
+        name, _, params = coding.partition(';')
+        qvalue = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    qvalue = float(value)
+                except ValueError:
+                    qvalue = 0.0
+        qvalues[name.strip().lower()] = qvalue
+    return qvalues.get('gzip', qvalues.get('*', 0.0)) > 0
+
+
+def page(instrumentId, parameter, start, end, cursor, limit):
+    """
+    A page of measurements ordered by id (the cursor), so the pages are stable while new measurements arrive.
+    :return: dict with the measurements and the cursor of the next page (None if it is the last one)
+    """
+    temps_data = TempData.objects.filter(instrumentId=instrumentId, queryDate__gte=start, queryDate__lt=end,
+                                         id__gt=cursor)
+    if parameter:
+        temps_data = temps_data.filter(parameterName=parameter)
+    rows = list(temps_data.order_by('id').values('id', 'parameterName', 'content', 'numericContent', 'unit',
+                                                 'queryDate')[:limit + 1])
+    return {
+        'instrumentId': instrumentId,
+        'measurements': rows[:limit],
+        'next': rows[limit - 1]['id'] if len(rows) > limit else None
+    }
+
+
+def downsampled(instrumentId, parameter, start, end, points, method):
+    """
+    The numeric series of a parameter downsampled to a number of points. The source is the coarsest rollup whose
+    resolution is not bigger than the buckets, or the measurements if the buckets are shorter than a minute.
+    :return: dict with the downsampled series
+    """
+    width = (end - start).total_seconds() / points
+    resolution = next((name for name, seconds in ROLLUP_SECONDS if seconds <= width), None)
+    rows = series(instrumentId, parameter, start, end, resolution)
+
+    if method == 'lttb':
+        limit = getattr(settings, 'MEASUREMENTS_MAX_LTTB_INPUT', 50000)
+        if series_queryset(instrumentId, parameter, start, end, resolution).count() > limit:
+            # LTTB needs all its input in memory, so a long series is reduced to the means of limit buckets first
+            input_width = (end - start).total_seconds() / limit
+            values = [(index * input_width + input_width / 2, mean)
+                      for index, count, mean, minimum, maximum in bucket_aggregate(rows, input_width, limit)]
+        else:
+            values = [(time, total / count) for time, count, total, minimum, maximum in rows]
+        sampled = lttb(values, points)
+        measurements = [{'date': start + timezone.timedelta(seconds=time), 'value': value} for time, value in sampled]
+    else:
+        measurements = [{'date': start + timezone.timedelta(seconds=index * width), 'count': count, 'mean': mean,
+                         'min': minimum, 'max': maximum}
+                        for index, count, mean, minimum, maximum in bucket_aggregate(rows, width, points)]
+    return {
+        'instrumentId': instrumentId,
+        'parameter': parameter,
+        'method': method,
+        'source': resolution or 'raw',
+        'measurements': measurements
+    }
+
+
+def series_queryset(instrumentId, parameter, start, end, resolution=None):
+    """
+    :param resolution: None for the measurements, 'minute' or 'hour' for the rollups
+    :return: queryset of the measurements or the rollups of a numeric series
+    """
+    if resolution is None:
+        return TempData.objects.filter(instrumentId=instrumentId, parameterName=parameter, queryDate__gte=start,
+                                       queryDate__lt=end, numericContent__isnull=False)
+    return MeasurementRollup.objects.filter(instrumentId=instrumentId, parameterName=parameter,
+                                            resolution=resolution, bucket__gte=start, bucket__lt=end)
+
+
+def series(instrumentId, parameter, start, end, resolution=None):
+    """
+    Read a numeric series with QuerySet.iterator(), so the rows are not cached by the queryset (the database driver
+    can still fetch them in big blocks, Django 1.8 has no server side cursors).
+    :param resolution: None for the measurements, 'minute' or 'hour' for the rollups
+    :return: generator of (seconds from start, count, total, minimum, maximum) ordered by time
+    """
+    values = series_queryset(instrumentId, parameter, start, end, resolution)
+    if resolution is None:
+        values = values.order_by('queryDate').values_list('queryDate', 'numericContent')
+        for date, value in values.iterator():
+            yield (date - start).total_seconds(), 1, value, value, value
+    else:
+        values = values.order_by('bucket').values_list('bucket', 'count', 'total', 'minimum', 'maximum')
+        for bucket, count, total, minimum, maximum in values.iterator():
+            yield (bucket - start).total_seconds(), count, total, minimum, maximum